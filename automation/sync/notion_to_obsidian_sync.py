@@ -7,11 +7,27 @@ notion_to_obsidian_sync.py
 
 运行：
   python automation_scripts\\notion_to_obsidian_sync.py
+  python automation_scripts\\notion_to_obsidian_sync.py --full   # 忽略游标，全量导出
+
+增量：记录已导出页面的 last_edited_time 高水位，只拉取之后编辑过的页面；
+内容哈希（忽略"同步时间"行）未变化的笔记不会重写。
+
+正文：并发拉取变化页面的 block 树（递归子 block、分页）并渲染为 Markdown。
+不缓存 block 树：增量模式只拉取 last_edited_time 已变化的页面，缓存几乎不会命中。
+
+写入：页面 ID → 文件名 由 notion_export_index.json 持久化（同名任务不会互相覆盖），
+通过临时文件 + os.replace 原子写入。
 
 注意：默认同步 Task Management 数据库，可通过 NOTION_DATABASE_ID 环境变量或 notion_databases.json 自动获取。
 """
 import os
+import re
 import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from dotenv import load_dotenv
 from datetime import datetime
@@ -40,26 +56,237 @@ HEADERS = {
     'Content-Type': 'application/json'
 }
 BASE_URL = 'https://api.notion.com/v1'
+STATE_PATH = os.path.join(os.path.dirname(__file__), 'notion_export_state.json')
+INDEX_PATH = os.path.join(os.path.dirname(__file__), 'notion_export_index.json')
+SYNC_TIME_PREFIX = '同步时间:'
+EXPORT_WORKERS = int(os.getenv('NOTION_EXPORT_WORKERS', '4'))
+RATE_LIMIT_PER_SEC = float(os.getenv('NOTION_RATE_LIMIT_PER_SEC', '3'))
+
+_rate_lock = threading.Lock()
+_next_slot = 0.0
+
+
+def _throttle():
+    """所有线程共享的限速 (默认 3 次/秒)"""
+    global _next_slot
+    if RATE_LIMIT_PER_SEC <= 0:
+        return
+    with _rate_lock:
+        now = time.monotonic()
+        wait = _next_slot - now
+        _next_slot = max(now, _next_slot) + 1.0 / RATE_LIMIT_PER_SEC
+    if wait > 0:
+        time.sleep(wait)
+
+
+def notion_request(method, url, params=None, payload=None, max_attempts=4):
+    """限速请求，429/5xx 按 Retry-After 或指数退避重试；最终失败时抛出 requests.RequestException"""
+    for attempt in range(1, max_attempts + 1):
+        _throttle()
+        try:
+            r = requests.request(method, url, headers=HEADERS, params=params, json=payload, timeout=30)
+        except requests.RequestException:
+            if attempt == max_attempts:
+                raise
+            time.sleep(2 ** (attempt - 1))
+            continue
+        if r.status_code == 429 or 500 <= r.status_code < 600:
+            if attempt == max_attempts:
+                r.raise_for_status()
+            time.sleep(float(r.headers.get('Retry-After') or 2 ** (attempt - 1)))
+            continue
+        r.raise_for_status()
+        return r.json()
+
+
+def notion_get(url, params=None, max_attempts=4):
+    """限速 GET (见 notion_request)"""
+    return notion_request('GET', url, params=params, max_attempts=max_attempts)
+
 
+def fetch_tasks(since=None):
+    """从 Notion Task Management 数据库分页查询未完成任务
 
-def fetch_tasks():
-    """从 Notion Task Management 数据库查询未完成任务"""
+    since: last_edited_time 游标 (ISO 时间)，仅返回此后编辑过的页面
+    任一分页请求最终失败都会抛出 requests.RequestException，不返回残缺列表。
+    """
     url = f'{BASE_URL}/databases/{NOTION_DATABASE_ID}/query'
-    payload = {
-        'filter': {
-            'property': 'Status',
-            'select': {'does_not_equal': '已完成'}
-        }
+    status_filter = {
+        'property': 'Status',
+        'select': {'does_not_equal': '已完成'}
     }
-    r = requests.post(url, headers=HEADERS, json=payload)
-    if r.status_code == 200:
-        return r.json().get('results', [])
+    if since:
+        query_filter = {'and': [
+            status_filter,
+            {'timestamp': 'last_edited_time', 'last_edited_time': {'on_or_after': since}},
+        ]}
     else:
-        print('API 查询失败:', r.status_code, r.text)
-        return []
+        query_filter = status_filter
+    payload = {
+        'filter': query_filter,
+        'sorts': [{'timestamp': 'last_edited_time', 'direction': 'ascending'}],
+        'page_size': 100,
+    }
+    results = []
+    while True:
+        data = notion_request('POST', url, payload=payload)
+        results.extend(data.get('results', []))
+        if not data.get('has_more') or not data.get('next_cursor'):
+            break
+        payload['start_cursor'] = data['next_cursor']
+    return results
+
+
+def load_state():
+    """读取导出状态: last_edited_time 高水位与各页面内容哈希"""
+    if os.path.exists(STATE_PATH):
+        try:
+            with open(STATE_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f'读取导出状态失败: {e}')
+    return {'last_edited_time': None, 'hashes': {}}
+
+
+def save_state(state):
+    """原子写入导出状态"""
+    tmp = STATE_PATH + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, STATE_PATH)
+
+
+def content_hash(md):
+    """Markdown 内容哈希（忽略每次都会变化的同步时间行）"""
+    lines = [ln for ln in md.splitlines() if not ln.startswith(SYNC_TIME_PREFIX)]
+    return hashlib.sha256('\n'.join(lines).encode('utf-8')).hexdigest()
+
+
+def fetch_children(block_id):
+    """分页获取 block 的直接子 block"""
+    url = f'{BASE_URL}/blocks/{block_id}/children'
+    params = {'page_size': 100}
+    children = []
+    while True:
+        data = notion_get(url, params)
+        children.extend(data.get('results', []))
+        if not data.get('has_more') or not data.get('next_cursor'):
+            return children
+        params['start_cursor'] = data['next_cursor']
 
 
-def notion_task_to_md(task):
+def fetch_block_tree(block_id):
+    """递归获取 block 树 (每层子 block 均实时请求)"""
+    tree = []
+    for child in fetch_children(block_id):
+        node = dict(child)
+        if child.get('has_children') and child.get('type') != 'child_page':
+            node['children'] = fetch_block_tree(child['id'])
+        tree.append(node)
+    return tree
+
+
+def rich_text_to_md(rich_text):
+    """Notion rich_text → Markdown 行内文本"""
+    parts = []
+    for rt in rich_text or []:
+        text = rt.get('plain_text', '')
+        if not text:
+            continue
+        ann = rt.get('annotations', {})
+        if rt.get('type') == 'equation':
+            text = f'${text}$'
+        elif ann.get('code'):
+            text = f'`{text}`'
+        if ann.get('bold'):
+            text = f'**{text}**'
+        if ann.get('italic'):
+            text = f'*{text}*'
+        if ann.get('strikethrough'):
+            text = f'~~{text}~~'
+        href = rt.get('href')
+        if href:
+            text = f'[{text}]({href})'
+        parts.append(text)
+    return ''.join(parts)
+
+
+def _file_url(data):
+    kind = data.get('type')
+    return (data.get(kind) or {}).get('url', '') if kind else ''
+
+
+def render_blocks(blocks, indent=''):
+    """block 树 → Markdown 行"""
+    lines = []
+    number = 0
+    for block in blocks:
+        btype = block.get('type')
+        data = block.get(btype, {}) or {}
+        text = rich_text_to_md(data.get('rich_text'))
+        number = number + 1 if btype == 'numbered_list_item' else 0
+        child_indent = indent
+        if btype in ('heading_1', 'heading_2', 'heading_3'):
+            lines.append(f"{indent}{'#' * int(btype[-1])} {text}")
+        elif btype == 'bulleted_list_item':
+            lines.append(f'{indent}- {text}')
+            child_indent = indent + '  '
+        elif btype == 'numbered_list_item':
+            lines.append(f'{indent}{number}. {text}')
+            child_indent = indent + '   '
+        elif btype == 'to_do':
+            lines.append(f"{indent}- [{'x' if data.get('checked') else ' '}] {text}")
+            child_indent = indent + '  '
+        elif btype == 'toggle':
+            lines.append(f'{indent}- {text}')
+            child_indent = indent + '  '
+        elif btype in ('quote', 'callout'):
+            lines.append(f'{indent}> {text}')
+        elif btype == 'code':
+            lines.append(f"{indent}```{data.get('language', '')}")
+            lines.extend(f'{indent}{ln}' for ln in ''.join(rt.get('plain_text', '') for rt in data.get('rich_text', [])).splitlines())
+            lines.append(f'{indent}```')
+        elif btype == 'equation':
+            lines.append(f"{indent}$$ {data.get('expression', '')} $$")
+        elif btype == 'divider':
+            lines.append(f'{indent}---')
+        elif btype in ('image', 'file', 'pdf', 'video', 'audio'):
+            caption = rich_text_to_md(data.get('caption')) or btype
+            prefix = '!' if btype == 'image' else ''
+            lines.append(f'{indent}{prefix}[{caption}]({_file_url(data)})')
+        elif btype in ('bookmark', 'embed', 'link_preview'):
+            url = data.get('url', '')
+            lines.append(f'{indent}[{rich_text_to_md(data.get("caption")) or url}]({url})')
+        elif btype == 'child_page':
+            lines.append(f"{indent}[[{data.get('title', '')}]]")
+        elif btype == 'table_row':
+            lines.append(f"{indent}| " + ' | '.join(rich_text_to_md(cell) for cell in data.get('cells', [])) + ' |')
+        elif btype == 'table':
+            rows = render_blocks(block.get('children', []), indent)
+            if rows and data.get('has_column_header'):
+                cols = len(block['children'][0].get('table_row', {}).get('cells', []))
+                rows.insert(1, f"{indent}|" + ' --- |' * cols)
+            lines.extend(rows)
+            continue
+        elif btype == 'paragraph':
+            lines.append(f'{indent}{text}')
+        elif text:
+            lines.append(f'{indent}{text}')
+        if block.get('children'):
+            lines.extend(render_blocks(block['children'], child_indent))
+    return lines
+
+
+def fetch_page_body(task):
+    """获取页面正文并渲染为 Markdown 行，失败时返回 None"""
+    try:
+        return render_blocks(fetch_block_tree(task['id']))
+    except requests.RequestException as e:
+        print(f"获取页面正文失败 {task.get('id')}: {e}")
+        return None
+
+
+def notion_task_to_md(task, body_lines=None):
     """将 Notion 任务转换为 Markdown 格式"""
     props = task.get('properties', {})
     
@@ -105,45 +332,164 @@ def notion_task_to_md(task):
     if note_link:
         md_lines.append(f"- 笔记链接: {note_link}")
     
+    if body_lines:
+        md_lines.extend(["", *body_lines])
+    
     md_lines.extend([
         "",
         "---",
-        f"同步时间: {datetime.now().strftime('%Y-%m-%d %H:%M')}",
+        f"{SYNC_TIME_PREFIX} {datetime.now().strftime('%Y-%m-%d %H:%M')}",
         ""
     ])
     
     return '\n'.join(md_lines)
 
 
-def save_md(title, md):
-    """保存 Markdown 文件到 Obsidian Vault"""
-    safe_title = title.replace('/', '_').replace('\\', '_').replace(':', '-')
-    path = os.path.join(OBSIDIAN_VAULT_PATH, f'{safe_title}.md')
-    
-    if DRY_RUN:
-        print(f'DRY_RUN: 将生成 Obsidian 笔记 {path}')
-        print(f'内容预览:\n{md[:200]}...\n')
-    else:
-        os.makedirs(OBSIDIAN_VAULT_PATH, exist_ok=True)
-        with open(path, 'w', encoding='utf-8') as f:
-            f.write(md)
+class VaultWriter:
+    """Obsidian Vault 写入器
+
+    - 页面 ID → 文件名 通过持久化索引保持稳定；同名任务追加页面 ID 前缀区分，不再互相覆盖
+    - 先写临时文件再 os.replace，中断的运行不会留下半截笔记
+    - 目录只创建一次，并统计写入数量与字节数
+    """
+    INVALID_CHARS = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+    def __init__(self, vault_path, index_path, dry_run=False):
+        self.vault_path = vault_path
+        self.index_path = index_path
+        self.dry_run = dry_run
+        self.index = {}
+        if os.path.exists(index_path):
+            try:
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    self.index = json.load(f)
+            except Exception as e:
+                print(f'读取文件名索引失败: {e}')
+        self._taken = {name.lower() for name in self.index.values()}
+        self._dirs = set()
+        self.written = 0
+        self.bytes_written = 0
+
+    def filename_for(self, page_id, title):
+        """页面对应的稳定文件名 (首次分配后写入索引)"""
+        name = self.index.get(page_id)
+        if name:
+            return name
+        base = self.INVALID_CHARS.sub('_', title.replace(':', '-')).strip().strip('.') or 'Untitled'
+        name = f'{base}.md'
+        if name.lower() in self._taken:
+            name = f"{base} ({page_id.replace('-', '')[:8]}).md"
+        self.index[page_id] = name
+        self._taken.add(name.lower())
+        return name
+
+    def path_for(self, page_id, title):
+        return os.path.join(self.vault_path, self.filename_for(page_id, title))
+
+    def read(self, page_id, title):
+        """读取已存在的笔记内容，不存在时返回 None"""
+        path = self.path_for(page_id, title)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except Exception:
+            return None
+
+    def write(self, page_id, title, md):
+        """原子写入笔记"""
+        path = self.path_for(page_id, title)
+        if self.dry_run:
+            print(f'DRY_RUN: 将生成 Obsidian 笔记 {path}')
+            print(f'内容预览:\n{md[:200]}...\n')
+            return
+        directory = os.path.dirname(path)
+        if directory not in self._dirs:
+            os.makedirs(directory, exist_ok=True)
+            self._dirs.add(directory)
+        data = md.encode('utf-8')
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self.written += 1
+        self.bytes_written += len(data)
         print(f'已同步到 Obsidian: {path}')
 
+    def save_index(self):
+        if self.dry_run:
+            return
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.index_path)
 
-def main():
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description='Notion → Obsidian 同步')
+    p.add_argument('--full', action='store_true', help='忽略 last_edited_time 游标，全量拉取')
+    return p.parse_args(argv)
+
+
+def main(argv=None):
     """主函数"""
+    args = parse_args(argv)
     if not NOTION_DATABASE_ID:
         print('错误: 未找到 NOTION_DATABASE_ID，请在 .env 中设置或确保 notion_databases.json 存在')
         return
     
-    tasks = fetch_tasks()
-    print(f'共找到 {len(tasks)} 个未完成任务\n')
+    state = load_state()
+    since = None if args.full else state.get('last_edited_time')
+    hashes = state.setdefault('hashes', {})
+    try:
+        tasks = fetch_tasks(since)
+    except requests.RequestException as e:
+        # 残缺列表会让游标越过未见过的页面，并在全量运行时漏掉页面，直接中止本次运行
+        print(f'API 查询失败，中止同步: {e}')
+        return
+    print(f'共找到 {len(tasks)} 个未完成任务' + (f'（{since} 之后编辑）' if since else '') + '\n')
+    
+    # 并发拉取正文 (受共享限速约束)
+    with ThreadPoolExecutor(max_workers=max(1, EXPORT_WORKERS)) as pool:
+        bodies = list(pool.map(fetch_page_body, tasks))
     
-    for t in tasks:
-        md = notion_task_to_md(t)
+    writer = VaultWriter(OBSIDIAN_VAULT_PATH, INDEX_PATH, dry_run=DRY_RUN)
+    written = 0
+    failed = 0
+    high_water = state.get('last_edited_time')
+    retry_from = None
+    for t, body in zip(tasks, bodies):
+        edited = t.get('last_edited_time')
+        if body is None:
+            # 正文获取失败: 游标不越过该页面，下次运行重试
+            failed += 1
+            if edited and (not retry_from or edited < retry_from):
+                retry_from = edited
+            continue
+        if edited and (not high_water or edited > high_water):
+            high_water = edited
+        md = notion_task_to_md(t, body)
         title_prop = t.get('properties', {}).get('Title', {}).get('title', [])
         title = title_prop[0].get('text', {}).get('content', 'Untitled') if title_prop else 'Untitled'
-        save_md(title, md)
+        digest = content_hash(md)
+        previous = hashes.get(t['id'])
+        if previous is None:
+            existing = writer.read(t['id'], title)
+            previous = content_hash(existing) if existing is not None else None
+        if previous == digest:
+            continue
+        writer.write(t['id'], title, md)
+        hashes[t['id']] = digest
+        written += 1
+    
+    if retry_from and (not high_water or retry_from < high_water):
+        high_water = retry_from
+    print(f'写入 {written} 个笔记 ({writer.bytes_written} 字节)，跳过 {len(tasks) - written - failed} 个未变化笔记，失败 {failed} 个')
+    if not DRY_RUN:
+        writer.save_index()
+        state['last_edited_time'] = high_water
+        save_state(state)
 
 
 if __name__ == '__main__':
@@ -7,6 +7,9 @@ Obsidian → Notion 同步脚本
 2. 解析 Markdown 内容、双链 [[链接]]、标签 #tag
 3. 同步到 Notion 复习数据库，保留知识图谱
 4. 支持增量更新和选择性发布
+5. 维护 vault 双链图谱索引，将 [[链接]] 解析为 Notion Relation
+6. 解析与网络请求流水线执行：进程池并行解析，主线程按限速写入 Notion
+7. 嵌入的图片/附件按内容哈希去重上传，复用本地 blob 缓存
 
 作者：Heritage Learning System
 版本：v1.0
@@ -15,10 +18,17 @@ Obsidian → Notion 同步脚本
 import os
 import re
 import json
+import time
+import hashlib
+import mimetypes
 import logging
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Optional, Set
+from typing import Deque, Dict, Iterator, List, Optional, Set
+from urllib.parse import unquote
 from dotenv import load_dotenv
 import requests
 
@@ -29,6 +39,13 @@ load_dotenv()
 OBSIDIAN_VAULT_PATH = os.getenv('OBSIDIAN_VAULT_PATH', './obsidian_vault')
 NOTION_REVIEW_DB_ID = os.getenv('NOTION_REVIEW_DB_ID')  # Notion 复习数据库 ID
 DRY_RUN = os.getenv('DRY_RUN', 'True').lower() not in ('false', '0', 'no')
+# 双链对应的 Notion Relation 属性 (需为复习数据库的自关联属性；默认不启用，仅写入 Related Notes 文本)
+NOTION_RELATION_PROPERTY = os.getenv('NOTION_RELATION_PROPERTY', '')
+# 并行解析进程数 (<=1 为串行) 与在途解析结果上限 (背压)
+SYNC_PARSE_WORKERS = int(os.getenv('SYNC_PARSE_WORKERS', str(min(4, os.cpu_count() or 1))))
+SYNC_QUEUE_SIZE = int(os.getenv('SYNC_QUEUE_SIZE', '32'))
+# Notion API 平均限速约 3 次/秒
+NOTION_RATE_LIMIT_PER_SEC = float(os.getenv('NOTION_RATE_LIMIT_PER_SEC', '3'))
 
 # 日志配置
 logging.basicConfig(
@@ -47,6 +64,21 @@ class NotionClient:
     """Notion API 客户端"""
     BASE_URL = "https://api.notion.com/v1"
     
+    _rate_lock = threading.Lock()
+    _next_slot = 0.0
+    
+    @staticmethod
+    def _throttle():
+        """按 NOTION_RATE_LIMIT_PER_SEC 匀速发出请求"""
+        if NOTION_RATE_LIMIT_PER_SEC <= 0:
+            return
+        with NotionClient._rate_lock:
+            now = time.monotonic()
+            wait = NotionClient._next_slot - now
+            NotionClient._next_slot = max(now, NotionClient._next_slot) + 1.0 / NOTION_RATE_LIMIT_PER_SEC
+        if wait > 0:
+            time.sleep(wait)
+    
     @staticmethod
     def _headers():
         api_key = os.getenv('NOTION_API_KEY')
@@ -56,6 +88,22 @@ class NotionClient:
             "Content-Type": "application/json"
         }
     
+    @staticmethod
+    def get_database(database_id: str) -> Optional[Dict]:
+        """获取数据库结构 (属性定义)"""
+        url = f"{NotionClient.BASE_URL}/databases/{database_id}"
+        try:
+            if DRY_RUN:
+                logger.info(f"DRY_RUN: 获取 Notion 数据库结构 {database_id}")
+                return None
+            NotionClient._throttle()
+            response = requests.get(url, headers=NotionClient._headers())
+            response.raise_for_status()
+            return response.json()
+        except requests.RequestException as e:
+            logger.error(f"获取 Notion 数据库结构失败: {e}")
+            return None
+    
     @staticmethod
     def query_database(database_id: str, filter_params: Optional[Dict] = None) -> List[Dict]:
         """查询数据库"""
@@ -66,6 +114,7 @@ class NotionClient:
             if DRY_RUN:
                 logger.info(f"DRY_RUN: 查询 Notion 数据库 {database_id}")
                 return []
+            NotionClient._throttle()
             response = requests.post(url, headers=NotionClient._headers(), json=payload)
             response.raise_for_status()
             return response.json().get('results', [])
@@ -73,6 +122,33 @@ class NotionClient:
             logger.error(f"Notion 查询失败: {e}")
             return []
     
+    @staticmethod
+    def query_database_all(database_id: str, filter_params: Optional[Dict] = None) -> Optional[List[Dict]]:
+        """分页查询数据库全部页面 (每次 100 条)；任一分页失败时返回 None，不返回残缺结果"""
+        url = f"{NotionClient.BASE_URL}/databases/{database_id}/query"
+        payload: Dict = {"page_size": 100}
+        if filter_params:
+            payload["filter"] = filter_params
+        results: List[Dict] = []
+        
+        try:
+            if DRY_RUN:
+                logger.info(f"DRY_RUN: 分页查询 Notion 数据库 {database_id}")
+                return []
+            while True:
+                NotionClient._throttle()
+                response = requests.post(url, headers=NotionClient._headers(), json=payload)
+                response.raise_for_status()
+                data = response.json()
+                results.extend(data.get('results', []))
+                if not data.get('has_more') or not data.get('next_cursor'):
+                    break
+                payload["start_cursor"] = data["next_cursor"]
+            return results
+        except requests.RequestException as e:
+            logger.error(f"Notion 分页查询失败 (已取得 {len(results)} 条，整体作废): {e}")
+            return None
+    
     @staticmethod
     def create_page(database_id: str, properties: Dict, children: List[Dict] = None) -> Optional[str]:
         """创建页面"""
@@ -89,6 +165,7 @@ class NotionClient:
                 logger.info(f"DRY_RUN: 创建 Notion 页面到数据库 {database_id}")
                 logger.debug(f"属性: {json.dumps(properties, ensure_ascii=False, indent=2)}")
                 return 'dry-run-page-id'
+            NotionClient._throttle()
             response = requests.post(url, headers=NotionClient._headers(), json=payload)
             response.raise_for_status()
             page_id = response.json().get('id')
@@ -100,6 +177,32 @@ class NotionClient:
                 logger.error(f"响应: {e.response.text}")
             return None
     
+    @staticmethod
+    def upload_file(file_path: Path, content_type: str) -> Optional[str]:
+        """上传文件 (Notion File Upload API，单次上传 ≤ 20MB)，返回 file_upload ID"""
+        headers = NotionClient._headers()
+        try:
+            if DRY_RUN:
+                logger.info(f"DRY_RUN: 上传附件 {file_path.name}")
+                return None
+            NotionClient._throttle()
+            response = requests.post(f"{NotionClient.BASE_URL}/file_uploads", headers=headers,
+                                     json={"filename": file_path.name, "content_type": content_type})
+            response.raise_for_status()
+            upload_id = response.json().get('id')
+            # multipart 上传由 requests 生成 Content-Type
+            headers.pop("Content-Type", None)
+            NotionClient._throttle()
+            with open(file_path, 'rb') as f:
+                response = requests.post(f"{NotionClient.BASE_URL}/file_uploads/{upload_id}/send", headers=headers,
+                                         files={"file": (file_path.name, f, content_type)})
+            response.raise_for_status()
+            logger.info(f"✓ 上传附件成功: {file_path.name}")
+            return upload_id
+        except requests.RequestException as e:
+            logger.error(f"上传附件失败 {file_path.name}: {e}")
+            return None
+    
     @staticmethod
     def update_page(page_id: str, properties: Dict) -> bool:
         """更新页面属性"""
@@ -110,6 +213,7 @@ class NotionClient:
             if DRY_RUN:
                 logger.info(f"DRY_RUN: 更新 Notion 页面 {page_id}")
                 return True
+            NotionClient._throttle()
             response = requests.patch(url, headers=NotionClient._headers(), json=payload)
             response.raise_for_status()
             logger.info(f"✓ 更新 Notion 页面成功: {page_id}")
@@ -126,6 +230,9 @@ class ObsidianParser:
     # 发布标签
     PUBLISH_TAGS = ['#publish', '#to-notion', '#复习']
     
+    # 嵌入附件: ![[图片.png|300]] 或 ![说明](路径/图片.png)
+    EMBED_PATTERN = re.compile(r'!\[\[([^\]]+)\]\]|!\[[^\]]*\]\(([^)]+)\)')
+    
     @staticmethod
     def extract_frontmatter(content: str) -> tuple[Dict, str]:
         """提取 YAML frontmatter"""
@@ -138,11 +245,18 @@ class ObsidianParser:
                 fm_text = parts[1].strip()
                 body = parts[2].strip()
                 
-                # 简单解析 YAML (仅支持 key: value 格式)
+                # 简单解析 YAML (支持 key: value 与 "- item" 列表格式)
+                last_key = None
                 for line in fm_text.split('\n'):
-                    if ':' in line:
+                    stripped = line.strip()
+                    if stripped.startswith('- ') and last_key:
+                        item = stripped[2:].strip()
+                        prev = frontmatter.get(last_key, '')
+                        frontmatter[last_key] = f"{prev}, {item}" if prev else item
+                    elif ':' in line:
                         key, value = line.split(':', 1)
-                        frontmatter[key.strip()] = value.strip()
+                        last_key = key.strip()
+                        frontmatter[last_key] = value.strip()
         
         return frontmatter, body
     
@@ -156,6 +270,22 @@ class ObsidianParser:
         """提取双链 [[链接]]"""
         return set(re.findall(r'\[\[([^\]]+)\]\]', content))
     
+    @staticmethod
+    def extract_aliases(frontmatter: Dict) -> List[str]:
+        """提取 frontmatter 中的别名 (aliases / alias)"""
+        raw = frontmatter.get('aliases') or frontmatter.get('alias') or ''
+        raw = raw.strip().strip('[]')
+        return [a.strip().strip('"\'') for a in raw.split(',') if a.strip().strip('"\'')]
+    
+    @staticmethod
+    def link_target(link: str) -> str:
+        """双链目标归一化: [[目录/笔记#标题|显示名]] → 笔记"""
+        target = link.split('|', 1)[0].split('#', 1)[0].strip()
+        target = target.rsplit('/', 1)[-1]
+        if target.lower().endswith('.md'):
+            target = target[:-3]
+        return target.strip()
+    
     @staticmethod
     def should_publish(content: str, tags: Set[str]) -> bool:
         """判断是否应该发布到 Notion"""
@@ -175,6 +305,10 @@ class ObsidianParser:
             if not line:
                 continue
             
+            # 嵌入的图片/附件
+            if ObsidianParser.EMBED_PATTERN.search(line) and ObsidianParser._embed_blocks(line, blocks):
+                continue
+            
             # 标题
             if line.startswith('#'):
                 level = len(re.match(r'^#+', line).group())
@@ -208,6 +342,407 @@ class ObsidianParser:
                 })
         
         return blocks[:100]  # Notion API 限制单次最多 100 个 blocks
+    
+    @staticmethod
+    def _embed_blocks(line: str, blocks: List[Dict]) -> bool:
+        """将含附件嵌入的行拆为段落 + 附件占位 block；不含附件 (如笔记嵌入) 时返回 False"""
+        parts: List[Dict] = []
+        has_attachment = False
+        pos = 0
+        for m in ObsidianParser.EMBED_PATTERN.finditer(line):
+            ref = (m.group(1) or m.group(2) or '').split('|', 1)[0].strip()
+            if m.group(2) and ref.startswith(('http://', 'https://')):
+                block = {"object": "block", "type": "image",
+                         "image": {"type": "external", "external": {"url": ref}}}
+            elif Path(ref).suffix and Path(ref).suffix.lower() != '.md':
+                # 本地附件: 占位，上传后由 AttachmentStore.materialize 替换
+                block = {"object": "block", "type": "attachment", "attachment": {"ref": ref}}
+            else:
+                continue
+            text = line[pos:m.start()].strip()
+            if text:
+                parts.append({"object": "block", "type": "paragraph",
+                              "paragraph": {"rich_text": [{"type": "text", "text": {"content": text}}]}})
+            parts.append(block)
+            has_attachment = True
+            pos = m.end()
+        if not has_attachment:
+            return False
+        text = line[pos:].strip()
+        if text:
+            parts.append({"object": "block", "type": "paragraph",
+                          "paragraph": {"rich_text": [{"type": "text", "text": {"content": text}}]}})
+        blocks.extend(parts)
+        return True
+
+def prepare_note(vault_path: Path, file_path: Path) -> Optional[Dict]:
+    """解析阶段: 读取并解析笔记，生成 Notion 属性与 blocks (不含网络请求)
+
+    定义为模块级函数以便在进程池中执行；不需要发布的笔记返回 None。
+    """
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+    except Exception as e:
+        logger.error(f"读取文件失败 {file_path}: {e}")
+        return None
+    
+    # 解析内容
+    frontmatter, body = ObsidianParser.extract_frontmatter(content)
+    tags = ObsidianParser.extract_tags(content)
+    wikilinks = ObsidianParser.extract_wikilinks(content)
+    
+    # 判断是否发布
+    if not ObsidianParser.should_publish(content, tags):
+        return None
+    
+    # 构建 Notion 属性
+    title = frontmatter.get('title', file_path.stem)
+    properties = {
+        "Name": {  # 使用 "Name" 而不是 "Title"
+            "title": [{"type": "text", "text": {"content": title}}]
+        },
+        "Source": {
+            "rich_text": [{"type": "text", "text": {"content": f"Obsidian: {file_path.name}"}}]
+        }
+    }
+    
+    # 添加标签(过滤掉发布标记)
+    filtered_tags = [tag for tag in tags if tag not in ['publish', 'to-notion', '复习']]
+    if filtered_tags:
+        properties["Tags"] = {
+            "multi_select": [{"name": tag} for tag in filtered_tags]
+        }
+    
+    # 如果有关联笔记（双链），添加到属性
+    if wikilinks:
+        properties["Related Notes"] = {
+            "rich_text": [{"type": "text", "text": {"content": ", ".join(wikilinks)}}]
+        }
+    
+    return {
+        'file_key': str(file_path.relative_to(vault_path)),
+        'name': file_path.name,
+        'title': title,
+        'source': f"Obsidian: {file_path.name}",
+        'properties': properties,
+        # 转换为 Notion blocks
+        'blocks': ObsidianParser.markdown_to_notion_blocks(body),
+    }
+
+# ==================== 双链图谱索引 ====================
+
+class VaultLinkIndex:
+    """Vault 双链图谱索引 (笔记 → 出链 / 反链 / 别名)
+
+    按文件 mtime 增量更新，持久化到 JSON，供同步时将 [[链接]] 解析为笔记路径。
+    """
+    
+    def __init__(self, index_file: Path):
+        self.index_file = index_file
+        self.notes: Dict[str, Dict] = {}
+        self.backlinks: Dict[str, List[str]] = {}
+        self._names: Dict[str, str] = {}
+        self._load()
+    
+    def _load(self):
+        """加载索引"""
+        if self.index_file.exists():
+            try:
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    self.notes = json.load(f).get('notes', {})
+            except Exception as e:
+                logger.warning(f"加载双链索引失败: {e}")
+                self.notes = {}
+        self._rebuild()
+    
+    def save(self):
+        """保存索引 (临时文件 + 原子替换)"""
+        tmp = self.index_file.with_suffix('.tmp')
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'notes': self.notes, 'backlinks': self.backlinks},
+                          f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.index_file)
+            logger.info(f"✓ 双链索引已保存: {self.index_file}")
+        except Exception as e:
+            logger.error(f"保存双链索引失败: {e}")
+    
+    def refresh(self, vault_path: Path, files: List[Path]) -> int:
+        """增量刷新: 仅重新解析 mtime 变化的文件，移除已删除的笔记"""
+        seen = set()
+        changed = 0
+        for file_path in files:
+            file_key = str(file_path.relative_to(vault_path))
+            seen.add(file_key)
+            try:
+                mtime = file_path.stat().st_mtime
+            except OSError:
+                continue
+            entry = self.notes.get(file_key)
+            if entry and entry.get('mtime') == mtime:
+                continue
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+            except Exception as e:
+                logger.warning(f"索引读取失败 {file_path}: {e}")
+                continue
+            frontmatter, _ = ObsidianParser.extract_frontmatter(content)
+            self.notes[file_key] = {
+                'title': frontmatter.get('title', file_path.stem),
+                'aliases': ObsidianParser.extract_aliases(frontmatter),
+                'links': sorted({ObsidianParser.link_target(l)
+                                 for l in ObsidianParser.extract_wikilinks(content)} - {''}),
+                'mtime': mtime,
+            }
+            changed += 1
+        removed = [k for k in self.notes if k not in seen]
+        for k in removed:
+            del self.notes[k]
+        self._rebuild()
+        logger.info(f"双链索引: 更新 {changed} 个, 移除 {len(removed)} 个, 共 {len(self.notes)} 个笔记")
+        return changed
+    
+    def _rebuild(self):
+        """重建名称索引 (文件名 > 标题 > 别名，大小写不敏感) 与反链"""
+        names: Dict[str, str] = {}
+        for field in ('stem', 'title', 'aliases'):
+            for file_key, entry in self.notes.items():
+                if field == 'stem':
+                    candidates = [Path(file_key).stem]
+                elif field == 'title':
+                    candidates = [entry.get('title', '')]
+                else:
+                    candidates = entry.get('aliases', [])
+                for name in candidates:
+                    if name:
+                        names.setdefault(name.lower(), file_key)
+        self._names = names
+        backlinks: Dict[str, Set[str]] = {}
+        for file_key, entry in self.notes.items():
+            for target in self.outgoing(file_key):
+                if target != file_key:
+                    backlinks.setdefault(target, set()).add(file_key)
+        self.backlinks = {k: sorted(v) for k, v in backlinks.items()}
+    
+    def outgoing(self, file_key: str) -> List[str]:
+        """笔记的出链 (已解析为笔记路径)"""
+        resolved = []
+        for link in self.notes.get(file_key, {}).get('links', []):
+            target = self._names.get(link.lower())
+            if target and target not in resolved:
+                resolved.append(target)
+        return resolved
+
+# ==================== 附件存储 ====================
+
+class AttachmentStore:
+    """附件上传与本地 blob 缓存
+
+    按 sha256 去重：相同内容的附件只上传一次，跨笔记、跨运行复用 file_upload ID。
+    文件摘要按 (mtime, size) 缓存，未变化的附件重同步时不再重新计算。
+    新上传的 blob 先记为待定，引用它的页面创建成功后才写入缓存 (commit)；
+    创建失败则丢弃 (discard)，Notion 会让未挂载的上传过期，不能跨运行复用。
+    """
+    
+    IMAGE_SUFFIXES = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.svg', '.bmp', '.tif', '.tiff', '.heic'}
+    MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+    
+    def __init__(self, vault_path: Path, cache_file: Path):
+        self.vault_path = vault_path
+        self.cache_file = cache_file
+        self.blobs: Dict[str, Dict] = {}
+        self.files: Dict[str, Dict] = {}
+        # 本轮上传、尚未挂载到页面的 blob (sha256 -> 条目)
+        self._pending: Dict[str, Dict] = {}
+        self._by_name: Optional[Dict[str, Path]] = None
+        self._dirty = False
+        if cache_file.exists():
+            try:
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.blobs = data.get('blobs', {})
+                self.files = data.get('files', {})
+            except Exception as e:
+                logger.warning(f"加载附件缓存失败: {e}")
+    
+    def save(self):
+        """保存附件缓存 (临时文件 + 原子替换)"""
+        if not self._dirty:
+            return
+        tmp = self.cache_file.with_suffix('.tmp')
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'blobs': self.blobs, 'files': self.files}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.cache_file)
+            self._dirty = False
+        except Exception as e:
+            logger.error(f"保存附件缓存失败: {e}")
+    
+    def resolve(self, ref: str, note_dir: Path) -> Optional[Path]:
+        """按 Obsidian 规则定位附件: 相对笔记路径 > vault 相对路径 > 全库文件名"""
+        ref = unquote(ref)
+        for candidate in (note_dir / ref, self.vault_path / ref):
+            if candidate.is_file():
+                return candidate
+        if self._by_name is None:
+            self._by_name = {}
+            for path in self.vault_path.rglob('*'):
+                if path.is_file() and path.suffix.lower() != '.md':
+                    self._by_name.setdefault(path.name.lower(), path)
+        return self._by_name.get(Path(ref).name.lower())
+    
+    def digest(self, path: Path) -> str:
+        """文件 sha256 (按 mtime/size 缓存；vault 外的附件以绝对路径为键)"""
+        resolved = path.resolve()
+        try:
+            key = str(resolved.relative_to(self.vault_path.resolve()))
+        except ValueError:
+            key = str(resolved)
+        stat = path.stat()
+        cached = self.files.get(key)
+        if cached and cached.get('mtime') == stat.st_mtime and cached.get('size') == stat.st_size:
+            return cached['sha256']
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        sha = h.hexdigest()
+        self.files[key] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha256': sha}
+        self._dirty = True
+        return sha
+    
+    def upload(self, path: Path) -> Optional[str]:
+        """上传附件 (内容已上传过则直接复用)"""
+        sha = self.digest(path)
+        cached = self.blobs.get(sha) or self._pending.get(sha)
+        if cached:
+            return cached['upload_id']
+        if path.stat().st_size > self.MAX_UPLOAD_BYTES:
+            logger.warning(f"附件超过 20MB，跳过上传: {path.name}")
+            return None
+        content_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+        upload_id = NotionClient.upload_file(path, content_type)
+        if upload_id:
+            self._pending[sha] = {'upload_id': upload_id, 'name': path.name, 'size': path.stat().st_size}
+        return upload_id
+    
+    def _pending_in(self, blocks: List[Dict]) -> List[str]:
+        """blocks 中引用的待定 blob (sha256)"""
+        ids = set()
+        for block in blocks:
+            ids.add(((block.get(block.get('type')) or {}).get('file_upload') or {}).get('id'))
+        return [sha for sha, entry in self._pending.items() if entry['upload_id'] in ids]
+    
+    def commit(self, blocks: List[Dict]):
+        """页面创建成功: 将其引用的待定 blob 写入缓存，供之后复用"""
+        for sha in self._pending_in(blocks):
+            self.blobs[sha] = self._pending.pop(sha)
+            self._dirty = True
+    
+    def discard(self, blocks: List[Dict]):
+        """页面创建失败: 丢弃其引用的待定 blob，下次重新上传"""
+        for sha in self._pending_in(blocks):
+            del self._pending[sha]
+    
+    def materialize(self, blocks: List[Dict], note_dir: Path) -> List[Dict]:
+        """将附件占位 block 替换为 image/pdf/file block；无法上传的保留为文本"""
+        result = []
+        for block in blocks:
+            if block.get('type') != 'attachment':
+                result.append(block)
+                continue
+            ref = block['attachment']['ref']
+            path = self.resolve(ref, note_dir)
+            upload_id = self.upload(path) if path else None
+            if not upload_id:
+                if not path:
+                    logger.warning(f"未找到附件: {ref}")
+                result.append({"object": "block", "type": "paragraph",
+                               "paragraph": {"rich_text": [{"type": "text", "text": {"content": f"![[{ref}]]"}}]}})
+                continue
+            suffix = path.suffix.lower()
+            block_type = 'image' if suffix in self.IMAGE_SUFFIXES else ('pdf' if suffix == '.pdf' else 'file')
+            result.append({"object": "block", "type": block_type,
+                           block_type: {"type": "file_upload", "file_upload": {"id": upload_id}}})
+        return result
+
+# ==================== 同步映射存储 ====================
+
+class SyncMapStore:
+    """同步映射持久化: JSON 快照 + 追加写 journal
+
+    每条新映射立即追加到 journal 并按批 fsync；每 checkpoint_every 条以
+    临时文件 + os.replace 原子写出快照并清空 journal (压缩)。
+    加载时读取快照并重放 journal，崩溃后重跑不会重复创建页面。
+    """
+    
+    def __init__(self, snapshot_file: Path, fsync_every: int = 10, checkpoint_every: int = 100):
+        self.snapshot_file = snapshot_file
+        self.journal_file = snapshot_file.with_suffix('.journal')
+        self.fsync_every = fsync_every
+        self.checkpoint_every = checkpoint_every
+        self.mapping: Dict[str, str] = {}
+        self._journal = None
+        self._unsynced = 0
+        self._since_checkpoint = 0
+        self._load()
+    
+    def _load(self):
+        """加载快照并重放 journal"""
+        if self.snapshot_file.exists():
+            try:
+                with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                    self.mapping.update(json.load(f))
+            except Exception as e:
+                logger.warning(f"加载同步映射失败: {e}")
+        if self.journal_file.exists():
+            replayed = 0
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 崩溃时可能残留半行，忽略
+                        continue
+                    self.mapping[entry['file']] = entry['page_id']
+                    replayed += 1
+            if replayed:
+                logger.info(f"从 journal 恢复 {replayed} 条同步映射")
+            # 立即压缩: journal 可能以残缺的半行结尾，继续追加会把下一条记录粘到半行后而丢失
+            self.checkpoint()
+    
+    def record(self, file_key: str, page_id: str):
+        """记录一条映射并追加到 journal"""
+        self.mapping[file_key] = page_id
+        if self._journal is None:
+            self._journal = open(self.journal_file, 'a', encoding='utf-8')
+        self._journal.write(json.dumps({'file': file_key, 'page_id': page_id}, ensure_ascii=False) + '\n')
+        self._journal.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every:
+            os.fsync(self._journal.fileno())
+            self._unsynced = 0
+        self._since_checkpoint += 1
+        if self._since_checkpoint >= self.checkpoint_every:
+            self.checkpoint()
+    
+    def checkpoint(self):
+        """原子写出快照并清空 journal"""
+        tmp = self.snapshot_file.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.mapping, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_file)
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if self.journal_file.exists():
+            self.journal_file.unlink()
+        self._unsynced = 0
+        self._since_checkpoint = 0
 
 # ==================== 同步引擎 ====================
 
@@ -218,23 +753,24 @@ class ObsidianNotionSync:
         self.vault_path = Path(vault_path)
         self.notion_db_id = notion_db_id
         self.sync_map_file = Path(__file__).parent / 'obsidian_notion_map.json'
-        self.sync_map = self._load_sync_map()
-    
-    def _load_sync_map(self) -> Dict[str, str]:
-        """加载同步映射 (Obsidian 文件路径 -> Notion 页面 ID)"""
-        if self.sync_map_file.exists():
-            try:
-                with open(self.sync_map_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                logger.warning(f"加载同步映射失败: {e}")
-        return {}
+        self.sync_store = SyncMapStore(self.sync_map_file)
+        self.sync_map = self.sync_store.mapping
+        self.link_index = VaultLinkIndex(Path(__file__).parent / 'obsidian_link_index.json')
+        self.attachments = AttachmentStore(self.vault_path, Path(__file__).parent / 'obsidian_attachment_cache.json')
+        # 出链中尚未同步的笔记 (file_key -> (page_id, 已写入的 Relation))，在本轮结束后补全 Relation
+        self._pending_relations: Dict[str, tuple[str, List[str]]] = {}
+        # 经数据库结构校验后的 Relation 属性名 (None 表示尚未校验)
+        self._relation_prop: Optional[str] = None
+        # 数据库中已有页面索引 (source:/title: -> page_id)，首次需要新建页面时构建
+        self._existing_pages: Optional[Dict[str, str]] = None
+        # 索引构建失败时本轮不再匹配/新建页面，避免把漏查的页面重复创建
+        self._existing_index_failed = False
+        self._claimed_pages: Set[str] = set()
     
     def _save_sync_map(self):
-        """保存同步映射"""
+        """保存同步映射 (原子写快照并压缩 journal)"""
         try:
-            with open(self.sync_map_file, 'w', encoding='utf-8') as f:
-                json.dump(self.sync_map, f, ensure_ascii=False, indent=2)
+            self.sync_store.checkpoint()
             logger.info(f"✓ 同步映射已保存: {self.sync_map_file}")
         except Exception as e:
             logger.error(f"保存同步映射失败: {e}")
@@ -251,69 +787,182 @@ class ObsidianNotionSync:
     
     def sync_file(self, file_path: Path) -> bool:
         """同步单个文件到 Notion"""
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-        except Exception as e:
-            logger.error(f"读取文件失败 {file_path}: {e}")
-            return False
-        
-        # 解析内容
-        frontmatter, body = ObsidianParser.extract_frontmatter(content)
-        tags = ObsidianParser.extract_tags(content)
-        wikilinks = ObsidianParser.extract_wikilinks(content)
-        
-        # 判断是否发布
-        if not ObsidianParser.should_publish(content, tags):
+        return self.push_note(prepare_note(self.vault_path, file_path))
+    
+    def push_note(self, note: Optional[Dict]) -> bool:
+        """网络阶段: 将解析好的笔记写入 Notion"""
+        if not note:
             return False
         
-        logger.info(f"→ 准备同步: {file_path.name}")
-        
-        # 构建 Notion 属性
-        title = frontmatter.get('title', file_path.stem)
-        properties = {
-            "Name": {  # 使用 "Name" 而不是 "Title"
-                "title": [{"type": "text", "text": {"content": title}}]
-            },
-            "Source": {
-                "rich_text": [{"type": "text", "text": {"content": f"Obsidian: {file_path.name}"}}]
-            }
-        }
-        
-        # 添加标签(过滤掉发布标记)
-        filtered_tags = [tag for tag in tags if tag not in ['publish', 'to-notion', '复习']]
-        if filtered_tags:
-            properties["Tags"] = {
-                "multi_select": [{"name": tag} for tag in filtered_tags]
-            }
+        logger.info(f"→ 准备同步: {note['name']}")
+        file_key = note['file_key']
+        properties = note['properties']
         
-        # 如果有关联笔记（双链），添加到属性
-        if wikilinks:
-            properties["Related Notes"] = {
-                "rich_text": [{"type": "text", "text": {"content": ", ".join(wikilinks)}}]
+        # 双链解析为 Notion Relation
+        relation_prop = self._relation_property()
+        relation_ids, unresolved = self._relation_targets(file_key)
+        if relation_prop and relation_ids:
+            properties[relation_prop] = {
+                "relation": [{"id": pid} for pid in relation_ids]
             }
         
-        # 转换为 Notion blocks
-        blocks = ObsidianParser.markdown_to_notion_blocks(body)
-        
-        # 检查是否已同步过
-        file_key = str(file_path.relative_to(self.vault_path))
+        # 检查是否已同步过 (同步映射缺失时按 Source/标题 匹配数据库中已有页面)
+        if file_key not in self.sync_map:
+            if not self._ensure_existing_index():
+                logger.warning(f"已有页面索引不可用，本轮跳过新建: {note['name']}")
+                return False
+            existing_id = self._match_existing_page(note)
+            if existing_id:
+                logger.info(f"匹配到已有 Notion 页面: {note['name']} -> {existing_id}")
+                self.sync_store.record(file_key, existing_id)
         
         if file_key in self.sync_map:
             # 更新已有页面
             page_id = self.sync_map[file_key]
             success = NotionClient.update_page(page_id, properties)
         else:
-            # 创建新页面
+            # 创建新页面 (先上传附件)
+            note_dir = (self.vault_path / file_key).parent
+            blocks = self.attachments.materialize(note['blocks'], note_dir)
             page_id = NotionClient.create_page(self.notion_db_id, properties, blocks)
             if page_id:
-                self.sync_map[file_key] = page_id
+                self.sync_store.record(file_key, page_id)
+                self.attachments.commit(blocks)
                 success = True
             else:
+                self.attachments.discard(blocks)
                 success = False
         
+        if success and unresolved and relation_prop:
+            self._pending_relations[file_key] = (page_id, relation_ids)
+        
         return success
     
+    def iter_prepared(self, files: List[Path]) -> Iterator[Optional[Dict]]:
+        """解析阶段: 进程池并行解析，按文件顺序产出结果
+
+        在途任务数不超过 SYNC_QUEUE_SIZE，网络阶段消费慢时解析自动暂停 (背压)，
+        大 vault 的内存占用保持有界。
+        """
+        if SYNC_PARSE_WORKERS <= 1 or len(files) < 2:
+            for file_path in files:
+                yield prepare_note(self.vault_path, file_path)
+            return
+        try:
+            executor = ProcessPoolExecutor(max_workers=SYNC_PARSE_WORKERS)
+        except (OSError, NotImplementedError) as e:
+            logger.warning(f"进程池不可用，改为串行解析: {e}")
+            for file_path in files:
+                yield prepare_note(self.vault_path, file_path)
+            return
+        window = max(SYNC_QUEUE_SIZE, SYNC_PARSE_WORKERS)
+        pending: Deque = deque()
+        remaining = iter(files)
+        try:
+            for file_path in remaining:
+                pending.append(executor.submit(prepare_note, self.vault_path, file_path))
+                if len(pending) >= window:
+                    break
+            while pending:
+                note = pending.popleft().result()
+                next_file = next(remaining, None)
+                if next_file is not None:
+                    pending.append(executor.submit(prepare_note, self.vault_path, next_file))
+                yield note
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+    
+    def _build_existing_index(self) -> Optional[Dict[str, str]]:
+        """分页查询目标数据库一次，建立 Source/标题 → 页面 ID 索引；查询失败时返回 None"""
+        index: Dict[str, str] = {}
+        pages = NotionClient.query_database_all(self.notion_db_id)
+        if pages is None:
+            return None
+        for page in pages:
+            if page.get('archived'):
+                continue
+            page_id = page.get('id')
+            props = page.get('properties', {})
+            source = ''.join(t.get('plain_text', '') for t in props.get('Source', {}).get('rich_text', []))
+            title = ''.join(t.get('plain_text', '') for t in props.get('Name', {}).get('title', []))
+            if source:
+                index.setdefault(f"source:{source.strip()}", page_id)
+            if title:
+                index.setdefault(f"title:{title.strip()}", page_id)
+        logger.info(f"已有页面索引: {len(pages)} 个页面")
+        return index
+    
+    def _ensure_existing_index(self) -> bool:
+        """首次调用时构建已有页面索引；构建失败后本轮始终返回 False (fail closed)"""
+        if self._existing_pages is None and not self._existing_index_failed:
+            index = self._build_existing_index()
+            if index is None:
+                self._existing_index_failed = True
+                logger.error("已有页面索引构建失败，本轮跳过所有未映射笔记的匹配与新建")
+            else:
+                self._existing_pages = index
+                self._claimed_pages = set(self.sync_map.values())
+        return self._existing_pages is not None
+    
+    def _match_existing_page(self, note: Dict) -> Optional[str]:
+        """在已有页面索引中查找笔记对应的页面 (优先 Source，其次标题)"""
+        if not self._ensure_existing_index():
+            return None
+        for key in (f"source:{note['source']}", f"title:{note['title']}"):
+            page_id = self._existing_pages.get(key)
+            if page_id and page_id not in self._claimed_pages:
+                self._claimed_pages.add(page_id)
+                return page_id
+        return None
+    
+    def _relation_property(self) -> str:
+        """返回可用的 Relation 属性名；未配置、数据库中不存在或类型不是 relation 时返回空串"""
+        if self._relation_prop is None:
+            self._relation_prop = ''
+            if NOTION_RELATION_PROPERTY:
+                database = NotionClient.get_database(self.notion_db_id) or {}
+                prop = database.get('properties', {}).get(NOTION_RELATION_PROPERTY)
+                if prop and prop.get('type') == 'relation':
+                    self._relation_prop = NOTION_RELATION_PROPERTY
+                else:
+                    logger.warning(f"数据库中没有 relation 类型的属性 '{NOTION_RELATION_PROPERTY}'，跳过双链 Relation")
+        return self._relation_prop
+    
+    def _relation_targets(self, file_key: str) -> tuple[List[str], bool]:
+        """返回出链对应的 Notion 页面 ID，以及是否存在尚未同步的出链笔记"""
+        relation_ids: List[str] = []
+        unresolved = False
+        for target in self.link_index.outgoing(file_key):
+            page_id = self.sync_map.get(target)
+            if page_id:
+                if page_id not in relation_ids:
+                    relation_ids.append(page_id)
+            elif target != file_key:
+                unresolved = True
+        return relation_ids[:100], unresolved  # Notion 单个 Relation 属性最多 100 项
+    
+    def resolve_pending_relations(self) -> int:
+        """第二遍: 为链接到本轮新建页面的笔记补全 Relation (仅在 Relation 集合变化时更新)"""
+        relation_prop = self._relation_property()
+        if not relation_prop:
+            self._pending_relations.clear()
+            return 0
+        updated = 0
+        for file_key, (page_id, sent_ids) in self._pending_relations.items():
+            relation_ids, _ = self._relation_targets(file_key)
+            if not relation_ids or set(relation_ids) == set(sent_ids):
+                continue
+            if NotionClient.update_page(page_id, {
+                relation_prop: {"relation": [{"id": pid} for pid in relation_ids]}
+            }):
+                updated += 1
+        self._pending_relations.clear()
+        if updated:
+            logger.info(f"✓ 补全双链 Relation: {updated} 个页面")
+        return updated
+    
     def sync_all(self):
         """同步所有符合条件的文件"""
         logger.info("=" * 50)
@@ -324,13 +973,20 @@ class ObsidianNotionSync:
         logger.info(f"Notion 数据库: {self.notion_db_id}")
         
         files = self.scan_vault()
+        self.link_index.refresh(self.vault_path, files)
         synced_count = 0
         
-        for file_path in files:
-            if self.sync_file(file_path):
-                synced_count += 1
-        
-        self._save_sync_map()
+        try:
+            for note in self.iter_prepared(files):
+                if self.push_note(note):
+                    synced_count += 1
+            
+            self.resolve_pending_relations()
+        finally:
+            # 中途异常/中断也写出快照，下次运行从断点继续
+            self._save_sync_map()
+            self.link_index.save()
+            self.attachments.save()
         
         logger.info("=" * 50)
         logger.info(f"同步完成: 成功 {synced_count}/{len(files)} 个文件")
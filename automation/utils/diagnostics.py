@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""Concurrent connectivity probes with per-phase latency timings.
+
+`run_probes` executes independent checks in parallel on daemon threads under a
+shared deadline, so a diagnostics run lasts as long as its slowest probe rather
+than the sum, and a probe stuck on a socket cannot keep the process alive. `measure_endpoint` splits a request into DNS, TCP connect, TLS
+handshake and time-to-first-byte; `render_timing_table` turns the results into
+an HTML table for the doctor report.
+"""
+from __future__ import annotations
+import html
+import socket
+import ssl
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+DEFAULT_PROBE_TIMEOUT = 15.0
+DEFAULT_PORTS = {"https": 443, "http": 80, "smtp": 587, "smtps": 465}
+
+Probe = Callable[[], Dict[str, Any]]
+
+
+def _ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def measure_endpoint(url: str, timeout: float = 10.0) -> Dict[str, Any]:
+    """Time DNS / connect / TLS / first byte for url (http(s) HEAD, or the smtp banner).
+
+    Returns {"dns_ms", "connect_ms", "tls_ms", "ttfb_ms", "total_ms"} with an
+    "error" key naming the failing phase when one fails.
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme or "https"
+    host = parts.hostname or ""
+    port = parts.port or DEFAULT_PORTS.get(scheme, 443)
+    timing: Dict[str, Any] = {}
+    begin = time.perf_counter()
+    phase = "dns"
+    sock: Optional[socket.socket] = None
+    try:
+        t = time.perf_counter()
+        family, stype, proto, _, addr = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+        timing["dns_ms"] = _ms(t)
+
+        phase = "connect"
+        t = time.perf_counter()
+        sock = socket.socket(family, stype, proto)
+        sock.settimeout(timeout)
+        sock.connect(addr)
+        timing["connect_ms"] = _ms(t)
+
+        if scheme in ("https", "smtps"):
+            phase = "tls"
+            t = time.perf_counter()
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=host)
+            timing["tls_ms"] = _ms(t)
+
+        phase = "ttfb"
+        t = time.perf_counter()
+        if scheme in ("http", "https"):
+            path = parts.path or "/"
+            sock.sendall(f"HEAD {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode("ascii"))
+        if not sock.recv(1):
+            raise ConnectionError("connection closed before first byte")
+        timing["ttfb_ms"] = _ms(t)
+    except Exception as e:
+        timing["error"] = f"{phase}: {e}"
+    finally:
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+    timing["total_ms"] = _ms(begin)
+    return timing
+
+
+def run_probes(probes: Dict[str, Probe], timeout: float = DEFAULT_PROBE_TIMEOUT) -> Dict[str, Dict[str, Any]]:
+    """Run probes concurrently; each result gains "elapsed_ms", timeouts/exceptions become ok=False.
+
+    Probes run on daemon threads, which the interpreter does not join at exit, so a
+    probe still blocked after the deadline is abandoned rather than waited for.
+    Probes should still bound their own I/O with timeouts of at most `timeout`.
+    """
+    results: Dict[str, Dict[str, Any]] = {}
+    if not probes:
+        return results
+    started = time.perf_counter()
+
+    def timed(fn: Probe, box: Dict[str, Any]):
+        t = time.perf_counter()
+        try:
+            res = dict(fn() or {})
+            res["elapsed_ms"] = _ms(t)
+            box["result"] = res
+        except Exception as e:
+            box["result"] = {"ok": False, "error": repr(e), "elapsed_ms": _ms(t)}
+
+    running = {}
+    for name, fn in probes.items():
+        box: Dict[str, Any] = {}
+        thread = threading.Thread(target=timed, args=(fn, box), name=f"probe-{name}", daemon=True)
+        thread.start()
+        running[name] = (thread, box)
+    for name, (thread, box) in running.items():
+        thread.join(max(0.0, timeout - (time.perf_counter() - started)))
+        if thread.is_alive() or "result" not in box:
+            results[name] = {"ok": False, "error": f"timeout after {timeout:g}s", "elapsed_ms": _ms(started)}
+        else:
+            results[name] = box["result"]
+    return results
+
+
+def render_timing_table(results: Dict[str, Dict[str, Any]]) -> str:
+    """HTML table of probe outcomes and phase timings (for doctor's report cards)."""
+    cols = ["dns_ms", "connect_ms", "tls_ms", "ttfb_ms", "total_ms"]
+    rows: List[str] = [
+        "<table style='border-collapse:collapse;width:100%'><tr>"
+        + "".join(f"<th style='text-align:left;padding:4px'>{h}</th>" for h in ["Probe", "Result", "DNS", "Connect", "TLS", "TTFB", "Total", "Elapsed"])
+        + "</tr>"
+    ]
+    for name, res in results.items():
+        timing = res.get("timing") or {}
+        ok = res.get("ok")
+        detail = res.get("error") or timing.get("error") or (f"status={res['status']}" if "status" in res else "")
+        css = "ok" if ok else "err"
+        cells = [
+            html.escape(name),
+            f"<span class='{css}'>{'OK' if ok else 'FAIL'}</span> {html.escape(str(detail))}",
+        ] + [f"{timing[c]:.0f} ms" if c in timing else "-" for c in cols] + [f"{res.get('elapsed_ms', 0):.0f} ms"]
+        rows.append("<tr>" + "".join(f"<td style='padding:4px;border-top:1px solid #e5e7eb'>{c}</td>" for c in cells) + "</tr>")
+    rows.append("</table>")
+    return "".join(rows)
+
+__all__ = [
+    "DEFAULT_PROBE_TIMEOUT",
+    "measure_endpoint",
+    "run_probes",
+    "render_timing_table",
+]
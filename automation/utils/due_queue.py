@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""Priority ordering of due review cards and load-balanced next-review dates.
+
+DueQueue pops the most at-risk cards first: longest overdue, then lowest Ease,
+then lowest stage. WorkloadIndex counts reviews already scheduled per day and
+moves each new `next_date` to the least loaded day inside a fuzz window around
+the SM-2 interval, under a daily cap (explicit, or derived from the backlog
+size), so a missed week drains evenly instead of piling onto a single day.
+
+Properties are read under the default names used by spaced_repetition.
+"""
+from __future__ import annotations
+import heapq
+import itertools
+from datetime import date, timedelta
+from typing import Any, Dict, Generic, Iterable, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Fuzz window = FUZZ_RATIO * interval days either side, capped; short intervals are not moved
+FUZZ_RATIO = 0.1
+MAX_FUZZ_DAYS = 7
+MIN_FUZZ_INTERVAL = 3
+# Without an explicit cap, a backlog of n cards is spread over at least BACKLOG_DRAIN_DAYS days
+BACKLOG_DRAIN_DAYS = 7
+MIN_AUTO_DAILY_CAP = 50
+
+
+def next_review_date(props: Dict[str, Any]) -> Optional[date]:
+    start = ((props.get("下次复习日期") or {}).get("date") or {}).get("start")
+    if not start:
+        return None
+    try:
+        return date.fromisoformat(start.split("T")[0])
+    except ValueError:
+        return None
+
+
+def _number(props: Dict[str, Any], name: str, default: float) -> float:
+    val = (props.get(name) or {}).get("number")
+    return float(val) if isinstance(val, (int, float)) else default
+
+
+def priority_key(props: Dict[str, Any], today: date) -> Tuple[int, float, int]:
+    """Smaller sorts first: (-overdue days, ease, stage). Cards never scheduled count as due today."""
+    due = next_review_date(props)
+    overdue = (today - due).days if due else 0
+    return (-overdue, _number(props, "Ease", 2.5), int(_number(props, "阶段 Stage", 0)))
+
+
+class DueQueue(Generic[T]):
+    """Min-heap of items ordered by priority_key of their properties (stable for ties)."""
+
+    def __init__(self, today: date):
+        self.today = today
+        self._heap: List[Tuple[Tuple[int, float, int], int, T]] = []
+        self._seq = itertools.count()
+
+    def push(self, item: T, props: Dict[str, Any]):
+        heapq.heappush(self._heap, (priority_key(props, self.today), next(self._seq), item))
+
+    def pop(self) -> T:
+        return heapq.heappop(self._heap)[2]
+
+    def take(self, n: Optional[int] = None) -> List[T]:
+        """Pop up to n items (all when n is None) in priority order."""
+        out: List[T] = []
+        while self._heap and (n is None or len(out) < n):
+            out.append(self.pop())
+        return out
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+
+class WorkloadIndex:
+    """Per-day count of scheduled reviews used to spread new next dates."""
+
+    def __init__(self, daily_cap: Optional[int] = None):
+        self.daily_cap = daily_cap if daily_cap and daily_cap > 0 else None
+        self.load: Dict[date, int] = {}
+
+    @classmethod
+    def for_backlog(cls, n_cards: int, daily_cap: Optional[int] = None) -> "WorkloadIndex":
+        """Index whose cap is daily_cap, or derived so n_cards drain over BACKLOG_DRAIN_DAYS."""
+        if not daily_cap:
+            daily_cap = max(MIN_AUTO_DAILY_CAP, -(-n_cards // BACKLOG_DRAIN_DAYS))
+        return cls(daily_cap)
+
+    def add(self, day: date, n: int = 1):
+        self.load[day] = self.load.get(day, 0) + n
+
+    def seed(self, cards_props: Iterable[Dict[str, Any]], after: date):
+        """Count existing future reviews (strictly after `after`)."""
+        for props in cards_props:
+            due = next_review_date(props)
+            if due and due > after:
+                self.add(due)
+
+    def pick_day(self, today: date, interval: int) -> date:
+        interval = max(1, interval)  # stored intervals may be 0; the next review is at least tomorrow
+        target = today + timedelta(days=interval)
+        fuzz = 0 if interval < MIN_FUZZ_INTERVAL else min(MAX_FUZZ_DAYS, max(1, round(interval * FUZZ_RATIO)))
+        lo = max(today + timedelta(days=1), target - timedelta(days=fuzz))
+        window = [lo + timedelta(days=i) for i in range((target - lo).days + fuzz + 1)]
+        best = min(window, key=lambda d: (self.load.get(d, 0), abs((d - target).days)))
+        if self.daily_cap:
+            day = best
+            while self.load.get(day, 0) >= self.daily_cap:
+                day += timedelta(days=1)
+            best = day
+        return best
+
+    def assign(self, schedule: Dict[str, Any], today: date) -> Dict[str, Any]:
+        """Return schedule with next_date/interval moved to a balanced day, and record it."""
+        day = self.pick_day(today, int(schedule["interval"]))
+        self.add(day)
+        return {**schedule, "next_date": day.isoformat(), "interval": (day - today).days}
+
+__all__ = [
+    "DueQueue",
+    "WorkloadIndex",
+    "priority_key",
+    "next_review_date",
+]
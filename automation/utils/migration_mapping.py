@@ -66,5 +66,30 @@ MAPPING_REGISTRY = {
     "assignments": ASSIGNMENT_MAPPING,
 }
 
+# Columns forming the stable unique key of a row: the title plus identity columns (course/type).
+# Editable data such as dates and links stays out of the key; changes to it are caught by the
+# content hash and become PATCHes. Override per kind with "unique_keys": {"knowledge": ["标题"]}
+# in the migration config.
+UNIQUE_KEY_FIELDS = {
+    "knowledge": ["标题", "课程"],
+    "tasks": ["任务标题", "关联课程"],
+    "resources": ["名称", "类型"],
+    "courses": ["课程名称", "开课学期"],
+    "assignments": ["作业标题", "所属课程"],
+}
+
+# Kind whose database every relation column of a kind points at (relations are resolved by title).
+RELATION_TARGETS = {
+    "tasks": "knowledge",
+    "resources": "knowledge",
+    "assignments": "knowledge",
+}
+
 def get_mapping(kind: str):
     return MAPPING_REGISTRY.get(kind, {})
+
+def get_unique_key_fields(kind: str):
+    return UNIQUE_KEY_FIELDS.get(kind, [])
+
+def get_relation_target(kind: str):
+    return RELATION_TARGETS.get(kind)
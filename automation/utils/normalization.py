@@ -1,10 +1,11 @@
 # -*- coding: utf-8 -*-
 """Normalization utilities for CSV → Notion migration."""
 from __future__ import annotations
+import calendar
 import re
 import unicodedata
-from datetime import datetime
-from typing import List, Optional
+from functools import lru_cache
+from typing import Iterable, List, Optional
 from urllib.parse import unquote
 
 DATE_FORMATS = ["%Y年%m月%d日", "%Y-%m-%d", "%Y/%m/%d", "%Y.%m.%d"]
@@ -26,27 +27,53 @@ STATUS_MAP = {
     "进行": "进行中",
 }
 
-MULTI_SPLIT_PATTERN = re.compile(r"[,，;；]\s*")
+MULTI_SPLIT_PATTERN = re.compile(r"[,，;；、]\s*")
+
+# Precompiled forms of DATE_FORMATS (plus yyyymmdd); groups are year, month, day
+DATE_PATTERNS = [
+    re.compile(r"^(\d{4})年(\d{1,2})月(\d{1,2})日$"),
+    re.compile(r"^(\d{4})-(\d{1,2})-(\d{1,2})$"),
+    re.compile(r"^(\d{4})/(\d{1,2})/(\d{1,2})$"),
+    re.compile(r"^(\d{4})\.(\d{1,2})\.(\d{1,2})$"),
+    re.compile(r"^(\d{4})(\d{2})(\d{2})$"),
+]
+
+NUMBER_PATTERN = re.compile(r"^[+-]?(?:\d+\.?\d*|\.\d+)$")
+NON_NUMERIC_PATTERN = re.compile(r"[^0-9.+-]")
+
+DATE_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def _parse_date_cached(raw: str) -> Optional[str]:
+    for pattern in DATE_PATTERNS:
+        m = pattern.match(raw)
+        if not m:
+            continue
+        year, month, day = (int(g) for g in m.groups())
+        if 1 <= year and 1 <= month <= 12 and 1 <= day <= calendar.monthrange(year, month)[1]:
+            return f"{year:04d}-{month:02d}-{day:02d}"
+        return None
+    return None
 
 
 def parse_date(raw: str) -> Optional[str]:
-    if not raw or not raw.strip():
+    """Parse any of DATE_FORMATS (or yyyymmdd) to an ISO date; None if unrecognized or invalid."""
+    if not raw:
         return None
     raw = raw.strip()
-    for fmt in DATE_FORMATS:
-        try:
-            dt = datetime.strptime(raw, fmt)
-            return dt.date().isoformat()
-        except ValueError:
-            continue
-    # Try digits only yyyymmdd
-    if re.match(r"^\d{8}$", raw):
-        try:
-            dt = datetime.strptime(raw, "%Y%m%d")
-            return dt.date().isoformat()
-        except ValueError:
-            pass
-    return None
+    return _parse_date_cached(raw) if raw else None
+
+
+def parse_dates(values: Iterable[str]) -> List[Optional[str]]:
+    """Vectorized parse_date: repeated values are parsed once."""
+    seen = {}
+    out = []
+    for v in values:
+        if v not in seen:
+            seen[v] = parse_date(v)
+        out.append(seen[v])
+    return out
 
 
 def normalize_priority(v: str) -> str:
@@ -60,10 +87,7 @@ def normalize_status(v: str) -> str:
 def split_multi(raw: str) -> List[str]:
     if not raw:
         return []
-    # Replace Chinese punctuation variants with comma
-    cleaned = raw.replace("、", ",")
-    parts = re.split(r"[,，;；]\s*", cleaned)
-    return [p.strip() for p in parts if p.strip()]
+    return [p.strip() for p in MULTI_SPLIT_PATTERN.split(raw) if p.strip()]
 
 
 def coerce_number(raw: str) -> Optional[float]:
@@ -72,15 +96,14 @@ def coerce_number(raw: str) -> Optional[float]:
     txt = raw.strip()
     if not txt:
         return None
-    try:
+    if NUMBER_PATTERN.match(txt):
         return float(txt)
+    try:
+        return float(txt)  # exponent / inf forms
     except ValueError:
         # Attempt to strip non-digit
-        txt2 = re.sub(r"[^0-9.+-]", "", txt)
-        try:
-            return float(txt2) if txt2 else None
-        except ValueError:
-            return None
+        txt2 = NON_NUMERIC_PATTERN.sub("", txt)
+        return float(txt2) if NUMBER_PATTERN.match(txt2) else None
 
 
 def decode_url(s: str) -> str:
@@ -113,6 +136,7 @@ def build_rich(value: str) -> dict:
 
 __all__ = [
     "parse_date",
+    "parse_dates",
     "normalize_priority",
     "normalize_status",
     "split_multi",
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""Shared Notion HTTP helpers: rate limiting, retries and bounded concurrent execution."""
+from __future__ import annotations
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, Optional, Tuple, TypeVar
+import requests
+
+NOTION_VERSION = "2022-06-28"
+NOTION_API = "https://api.notion.com/v1"
+
+T = TypeVar("T")
+R = TypeVar("R")
+_SENTINEL = object()
+
+
+def notion_headers(token: str) -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {token}",
+        "Notion-Version": NOTION_VERSION,
+        "Content-Type": "application/json",
+    }
+
+
+class RateLimiter:
+    """Thread-safe limiter spacing requests evenly at `per_sec` (Notion averages 3 req/s)."""
+
+    def __init__(self, per_sec: float = 3.0):
+        self.interval = 1.0 / per_sec if per_sec > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def request_with_retry(
+    method: str,
+    url: str,
+    token: str,
+    json_payload: Optional[Dict[str, Any]] = None,
+    limiter: Optional[RateLimiter] = None,
+    timeout: int = 30,
+    max_attempts: int = 3,
+    base_sleep: float = 2.0,
+    session: Optional[requests.Session] = None,
+) -> Optional[requests.Response]:
+    """Send a request, retrying 429/5xx and network errors with exponential backoff.
+
+    Honors Retry-After on 429. Returns the last response (possibly non-2xx) or None
+    when every attempt failed at the network level.
+    """
+    http = session or requests
+    last: Optional[requests.Response] = None
+    for attempt in range(1, max_attempts + 1):
+        if limiter:
+            limiter.wait()
+        try:
+            last = http.request(method, url, headers=notion_headers(token), json=json_payload, timeout=timeout)
+        except requests.RequestException:
+            last = None
+        else:
+            if last.status_code != 429 and not 500 <= last.status_code < 600:
+                return last
+        if attempt < max_attempts:
+            retry_after = last.headers.get("Retry-After") if last is not None else None
+            try:
+                delay = float(retry_after) if retry_after else base_sleep * 2 ** (attempt - 1)
+            except ValueError:
+                delay = base_sleep * 2 ** (attempt - 1)
+            time.sleep(delay)
+    return last
+
+
+def ordered_map(
+    fn: Callable[[T], R],
+    items: Iterable[T],
+    executor: Executor,
+    window: int,
+    on_abandon: Optional[Callable[[T, R], None]] = None,
+) -> Iterator[Tuple[T, R]]:
+    """Run fn over items on executor, yielding (item, result) in input order.
+
+    At most `window` calls are in flight; items are pulled lazily, so a streaming
+    input stays bounded in memory. Exceptions raised by fn propagate to the caller
+    when their result is reached; pending calls are cancelled when the consumer stops.
+    Calls already running cannot be cancelled: with `on_abandon`, closing the
+    iterator waits for them and passes each (item, result) to it, so side effects
+    such as created pages are not lost.
+    """
+    pending: Deque = deque()
+    source = iter(items)
+    try:
+        for item in source:
+            pending.append((item, executor.submit(fn, item)))
+            if len(pending) >= window:
+                break
+        while pending:
+            item, future = pending.popleft()
+            result = future.result()
+            nxt = next(source, _SENTINEL)
+            if nxt is not _SENTINEL:
+                pending.append((nxt, executor.submit(fn, nxt)))
+            yield item, result
+    finally:
+        # cancel everything queued first, then wait only for calls that were already running
+        running = [(item, future) for item, future in pending if not future.cancel()]
+        if on_abandon is not None:
+            for item, future in running:
+                try:
+                    on_abandon(item, future.result())
+                except Exception:
+                    pass
+
+__all__ = [
+    "NOTION_VERSION",
+    "NOTION_API",
+    "notion_headers",
+    "RateLimiter",
+    "request_with_retry",
+    "ordered_map",
+]
@@ -3,90 +3,203 @@
 from __future__ import annotations
 import json
 import os
-import time
-from typing import Dict, Optional
-import requests
+import re
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Set
+
+from automation.utils.notion_api import NOTION_API, RateLimiter, request_with_retry
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_title(title: str) -> str:
+    """Index key for a page title: NFKC, trimmed, whitespace collapsed, case-folded."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", title)).strip().casefold()
 
-NOTION_VERSION = "2022-06-28"
 
 class RelationResolver:
-    def __init__(self, token: str, cache_path: str):
+    """Resolve relation titles to page ids of a target database.
+
+    The target database is queried once (paginated) into a normalized-title index;
+    titles still missing are created in one concurrent batch via `prefetch`.
+    The cache is kept per target database, and a fresh index replaces what was
+    cached for that database, so deleted or archived pages drop out.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        cache_path: str,
+        limiter: Optional[RateLimiter] = None,
+        max_attempts: int = 3,
+        base_sleep: float = 2.0,
+        title_property: str = "名称",
+    ):
         self.token = token
         self.cache_path = cache_path
-        self._cache: Dict[str, str] = {}
+        self.limiter = limiter
+        self.max_attempts = max_attempts
+        self.base_sleep = base_sleep
+        self.title_property = title_property
+        self._cache: Dict[str, Dict[str, str]] = {}
+        # Entries of the old flat cache format (no database id); used only until a database is indexed
+        self._legacy: Dict[str, str] = {}
+        self._indexed: Set[str] = set()
+        self._lock = threading.Lock()
+        # Serializes index builds and miss batches so concurrent importers never create a title twice
+        self._batch_lock = threading.RLock()
         self._load()
 
     def _load(self):
+        self._cache, self._legacy = {}, {}
         if os.path.exists(self.cache_path):
             try:
                 with open(self.cache_path, "r", encoding="utf-8") as f:
-                    self._cache = json.load(f)
+                    raw = json.load(f)
+                if "databases" in raw:
+                    self._cache = raw.get("databases", {})
+                    self._legacy = raw.get("legacy", {})
+                else:
+                    # Older caches were a flat title -> id map keyed by the stripped title
+                    self._legacy = {normalize_title(k): v for k, v in raw.items() if isinstance(v, str)}
             except Exception:
-                self._cache = {}
-        else:
-            self._cache = {}
+                self._cache, self._legacy = {}, {}
 
     def save(self):
         tmp = self.cache_path + ".tmp"
+        with self._lock:
+            data = {"databases": {db: dict(m) for db, m in self._cache.items()}, "legacy": dict(self._legacy)}
         with open(tmp, "w", encoding="utf-8") as f:
-            json.dump(self._cache, f, ensure_ascii=False, indent=2)
+            json.dump(data, f, ensure_ascii=False, indent=2)
         os.replace(tmp, self.cache_path)
 
-    def ensure(self, title: str, db_id: str) -> Optional[str]:
-        """Return page ID for title, create if missing."""
-        norm_title = title.strip()
-        if not norm_title:
-            return None
-        if norm_title in self._cache:
-            return self._cache[norm_title]
-        page_id = self._search(norm_title)
-        if page_id:
-            self._cache[norm_title] = page_id
-            return page_id
-        created_id = self._create_minimal(norm_title, db_id)
-        if created_id:
-            self._cache[norm_title] = created_id
-        return created_id
-
-    def _headers(self):
-        return {
-            "Authorization": f"Bearer {self.token}",
-            "Notion-Version": NOTION_VERSION,
-            "Content-Type": "application/json",
-        }
+    def _request(self, method: str, url: str, payload: Optional[Dict] = None):
+        return request_with_retry(
+            method, url, self.token, payload, limiter=self.limiter, timeout=30,
+            max_attempts=self.max_attempts, base_sleep=self.base_sleep,
+        )
+
+    def build_index(self, db_id: str) -> Optional[int]:
+        """Load every page title of db_id into the cache (once per database).
+
+        Returns pages indexed (0 when already indexed), or None when the query failed;
+        the database then stays unindexed so the next call retries.
+        """
+        with self._batch_lock:
+            if not db_id or db_id in self._indexed:
+                return 0
+            indexed = self._query_index(db_id)
+            if indexed is not None:
+                self._indexed.add(db_id)
+            return indexed
 
-    def _search(self, query: str) -> Optional[str]:
-        url = "https://api.notion.com/v1/search"
-        body = {"query": query, "filter": {"value": "page", "property": "object"}, "page_size": 5}
-        try:
-            r = requests.post(url, headers=self._headers(), json=body, timeout=20)
-            if r.status_code != 200:
+    def invalidate(self, db_id: str):
+        """Forget that db_id was indexed, e.g. after pages were imported into it."""
+        with self._batch_lock:
+            self._indexed.discard(db_id)
+
+    def _query_index(self, db_id: str) -> Optional[int]:
+        found: Dict[str, str] = {}
+        body: Dict = {"page_size": 100}
+        while True:
+            r = self._request("POST", f"{NOTION_API}/databases/{db_id}/query", body)
+            if r is None or r.status_code != 200:
+                status = r.status_code if r is not None else "no response"
+                print(f"[WARN] relation index query failed db={db_id} status={status}")
+                # a partial index would make existing titles look missing; keep nothing
                 return None
             data = r.json()
-            for res in data.get("results", []):
-                props = res.get("properties", {})
-                if res.get("object") == "page":
-                    # Accept first match
-                    return res.get("id")
-        except Exception:
+            for page in data.get("results", []):
+                for prop in page.get("properties", {}).values():
+                    if prop.get("type") == "title":
+                        text = "".join(t.get("plain_text", "") for t in prop.get("title", []))
+                        key = normalize_title(text)
+                        if key:
+                            found.setdefault(key, page.get("id"))
+                        break
+            if not data.get("has_more"):
+                break
+            body["start_cursor"] = data.get("next_cursor")
+        with self._lock:
+            # the fresh index wins over anything cached earlier (deleted/archived targets drop out)
+            self._cache[db_id] = found
+        print(f"[INFO] relation index db={db_id} pages={len(found)}")
+        return len(found)
+
+    def lookup(self, title: str, db_id: str) -> Optional[str]:
+        """Return the cached page id for title in db_id without any network call."""
+        key = normalize_title(title)
+        if not key:
             return None
-        return None
+        page_id = self._cache.get(db_id, {}).get(key)
+        if page_id is None and db_id not in self._indexed:
+            page_id = self._legacy.get(key)
+        return page_id
+
+    def prefetch(self, titles: Iterable[str], db_id: str, concurrency: int = 3, dry_run: bool = False) -> int:
+        """Index db_id, then create all distinct missing titles concurrently. Returns pages created."""
+        with self._batch_lock:
+            return self._prefetch(titles, db_id, concurrency, dry_run)
+
+    def _prefetch(self, titles: Iterable[str], db_id: str, concurrency: int, dry_run: bool) -> int:
+        if self.build_index(db_id) is None:
+            print(f"[WARN] relation index unavailable db={db_id}; not creating missing targets")
+            return 0
+        missing: Dict[str, str] = {}
+        for title in titles:
+            key = normalize_title(title)
+            if key and key not in self._cache.get(db_id, {}) and key not in missing:
+                missing[key] = title.strip()
+        if not missing:
+            return 0
+        if dry_run:
+            print(f"[INFO] relation targets to create db={db_id} count={len(missing)} [dry-run]")
+            return 0
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            created = list(pool.map(lambda t: self._create_minimal(t, db_id), missing.values()))
+        with self._lock:
+            bucket = self._cache.setdefault(db_id, {})
+            for key, page_id in zip(missing, created):
+                if page_id:
+                    bucket[key] = page_id
+        ok = sum(1 for c in created if c)
+        print(f"[INFO] relation targets created db={db_id} created={ok} failed={len(created) - ok}")
+        return ok
+
+    def ensure(self, title: str, db_id: str) -> Optional[str]:
+        """Return page ID for title, create if missing."""
+        key = normalize_title(title)
+        if not key:
+            return None
+        indexed = self.build_index(db_id) is not None
+        if not indexed:
+            # unknown whether the title exists; leave the relation empty rather than risk a duplicate
+            return None
+        bucket = self._cache.setdefault(db_id, {})
+        if key in bucket:
+            return bucket[key]
+        with self._batch_lock:
+            if key in bucket:
+                return bucket[key]
+            created_id = self._create_minimal(title.strip(), db_id)
+            if created_id:
+                with self._lock:
+                    bucket.setdefault(key, created_id)
+        return bucket.get(key)
 
     def _create_minimal(self, title: str, db_id: str) -> Optional[str]:
-        url = "https://api.notion.com/v1/pages"
         body = {
             "parent": {"database_id": db_id},
-            "properties": {"名称": {"title": [{"text": {"content": title}}]}},
+            "properties": {self.title_property: {"title": [{"text": {"content": title}}]}},
         }
-        try:
-            r = requests.post(url, headers=self._headers(), json=body, timeout=30)
-            if r.status_code == 200:
-                return r.json().get("id")
-        except Exception:
-            return None
+        r = self._request("POST", f"{NOTION_API}/pages", body)
+        if r is not None and r.status_code == 200:
+            return r.json().get("id")
         return None
 
 # Convenience factory
 
-def build_relation_resolver(token: str, cache_path: str) -> RelationResolver:
-    return RelationResolver(token=token, cache_path=cache_path)
+def build_relation_resolver(token: str, cache_path: str, **kwargs) -> RelationResolver:
+    return RelationResolver(token=token, cache_path=cache_path, **kwargs)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""Disk-backed cache of Notion database schemas shared by the workflows.
+
+Schemas are keyed by database id and expire after a TTL (NOTION_SCHEMA_TTL
+seconds, default 1 hour). Property PATCHes go through `patch_properties`, which
+replaces the cached entry with the updated schema returned by Notion.
+"""
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from automation.utils.notion_api import NOTION_API, request_with_retry
+
+SCHEMA_CACHE_PATH = os.getenv("NOTION_SCHEMA_CACHE", "automation/utils/notion_schema_cache.json")
+SCHEMA_TTL_SECONDS = int(os.getenv("NOTION_SCHEMA_TTL", "3600"))
+
+# Logical field -> (default property name, accepted alternative names, property type)
+REVIEW_PROPERTIES: Dict[str, Tuple[str, List[str], str]] = {
+    "title": ("卡片标题", [], "title"),
+    "stage": ("阶段 Stage", ["Stage", "阶段"], "number"),
+    "ease": ("Ease", ["ease", "难易度"], "number"),
+    "interval": ("Interval", ["interval", "间隔"], "number"),
+    "status": ("状态", ["Status", "status"], "select"),
+    "last_date": ("上次复习日期", ["Last Review"], "date"),
+    "next_date": ("下次复习日期", ["Next Review"], "date"),
+    "tags": ("标签", ["Tags", "tags"], "multi_select"),
+    "knowledge": ("关联知识点", [], "relation"),
+}
+
+TASKS_PROPERTIES: Dict[str, Tuple[str, List[str], str]] = {
+    "title": ("名称", [], "title"),
+    "status": ("状态", ["status", "Status", "任务状态"], "select"),
+    "relation": ("关联复习卡", [], "relation"),
+}
+
+
+def _compact(db: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep only what the workflows use: property name -> type (+ select options)."""
+    props: Dict[str, Any] = {}
+    for name, meta in db.get("properties", {}).items():
+        if not isinstance(meta, dict):
+            continue
+        entry: Dict[str, Any] = {"type": meta.get("type")}
+        options = (meta.get(meta.get("type")) or {}).get("options") if meta.get("type") in ("select", "multi_select") else None
+        if options is not None:
+            entry["options"] = [o.get("name") for o in options]
+        props[name] = entry
+    return {"properties": props}
+
+
+class SchemaCache:
+    def __init__(self, path: str = SCHEMA_CACHE_PATH, ttl: int = SCHEMA_TTL_SECONDS):
+        self.path = Path(path)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        if self.path.exists():
+            try:
+                self._entries = json.loads(self.path.read_text(encoding="utf-8"))
+            except Exception:
+                self._entries = {}
+
+    def _save(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self._entries, ensure_ascii=False, indent=2), encoding="utf-8")
+            tmp.replace(self.path)
+        except OSError as e:
+            print(f"[WARN] schema cache not saved: {e}")
+
+    def _store(self, db_id: str, db: Dict[str, Any]) -> Dict[str, Any]:
+        entry = {"fetched_at": time.time(), **_compact(db)}
+        with self._lock:
+            self._entries[db_id] = entry
+            self._save()
+        return entry
+
+    def get(self, token: str, db_id: str, refresh: bool = False) -> Dict[str, Any]:
+        """Return {"fetched_at", "properties": {name: {"type", "options"?}}}; GETs only when stale."""
+        entry = self._entries.get(db_id)
+        if entry and not refresh and time.time() - entry.get("fetched_at", 0) < self.ttl:
+            return entry
+        r = request_with_retry("GET", f"{NOTION_API}/databases/{db_id}", token, timeout=40)
+        if r is None or r.status_code != 200:
+            status = r.status_code if r is not None else "no response"
+            body = r.text[:200] if r is not None else ""
+            raise RuntimeError(f"fetch database schema failed status={status} body={body}")
+        return self._store(db_id, r.json())
+
+    def invalidate(self, db_id: str):
+        with self._lock:
+            if self._entries.pop(db_id, None) is not None:
+                self._save()
+
+    def patch_properties(self, token: str, db_id: str, properties: Dict[str, Any]) -> Dict[str, Any]:
+        """PATCH database properties; the cached schema is replaced by Notion's response."""
+        self.invalidate(db_id)
+        r = request_with_retry("PATCH", f"{NOTION_API}/databases/{db_id}", token, {"properties": properties}, timeout=60)
+        if r is None or r.status_code != 200:
+            status = r.status_code if r is not None else "no response"
+            body = r.text[:240] if r is not None else ""
+            raise RuntimeError(f"update database props failed status={status} body={body}")
+        return self._store(db_id, r.json())
+
+
+def resolve_property_names(schema: Optional[Dict[str, Any]], spec: Dict[str, Tuple[str, List[str], str]]) -> Dict[str, str]:
+    """Map logical fields to the database's actual property names (defaults when absent)."""
+    props = (schema or {}).get("properties", {})
+    names: Dict[str, str] = {}
+    for field, (default, alternatives, ptype) in spec.items():
+        of_type = [n for n, m in props.items() if m.get("type") == ptype]
+        by_lower = {}
+        for n in of_type:
+            by_lower.setdefault(n.lower(), n)
+        # exact default first, then alternatives in their listed order (not schema order)
+        match = default if default in of_type else next(
+            (by_lower[c.lower()] for c in [default] + alternatives if c.lower() in by_lower), None)
+        if match is None and ptype in ("title", "relation") and of_type:
+            match = of_type[0]  # a database has one title; relations are matched by type alone
+        names[field] = match or default
+    return names
+
+
+def default_property_names(spec: Dict[str, Tuple[str, List[str], str]]) -> Dict[str, str]:
+    return {field: default for field, (default, _, _) in spec.items()}
+
+
+_shared: Optional[SchemaCache] = None
+
+
+def get_schema_cache() -> SchemaCache:
+    """Process-wide cache instance so every workflow in one run shares fetched schemas."""
+    global _shared
+    if _shared is None:
+        _shared = SchemaCache()
+    return _shared
+
+__all__ = [
+    "SCHEMA_CACHE_PATH",
+    "SCHEMA_TTL_SECONDS",
+    "REVIEW_PROPERTIES",
+    "TASKS_PROPERTIES",
+    "SchemaCache",
+    "resolve_property_names",
+    "default_property_names",
+    "get_schema_cache",
+]
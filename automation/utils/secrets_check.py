@@ -3,13 +3,25 @@ secrets_check.py
 
 验证 GitHub Actions Secrets 是否存在，并进行基本连通性检测。
 不会写入任何外部系统。
+各服务检测与 DNS/连接/TLS/首字节 计时并发执行，总耗时约等于最慢的一项。
 """
 import os
 import sys
 import json
 import smtplib
+from pathlib import Path
 import requests
 
+_ROOT = Path(__file__).resolve().parent.parent.parent
+if str(_ROOT) not in sys.path:
+    sys.path.insert(0, str(_ROOT))
+
+from automation.utils.diagnostics import measure_endpoint, run_probes
+
+PROBE_TIMEOUT = 15
+# 复用连接池（各检测共享）
+SESSION = requests.Session()
+
 REQUIRED_SECRETS = [
     'NOTION_API_KEY',
     'NOTION_DATABASE_ID',
@@ -45,7 +57,7 @@ def check_notion():
     }
     url = f'https://api.notion.com/v1/databases/{db_id}/query'
     try:
-        r = requests.post(url, headers=headers, json={'page_size': 1}, timeout=10)
+        r = SESSION.post(url, headers=headers, json={'page_size': 1}, timeout=10)
         return {'ok': r.status_code in (200, 400), 'status': r.status_code}
     except Exception as e:
         return {'ok': False, 'error': str(e)}
@@ -60,7 +72,7 @@ def check_github():
     url = f'https://api.github.com/repos/{owner}/{name}'
     headers = {'Authorization': f'token {token}', 'Accept': 'application/vnd.github+json'}
     try:
-        r = requests.get(url, headers=headers, timeout=10)
+        r = SESSION.get(url, headers=headers, timeout=10)
         return {'ok': r.status_code == 200, 'status': r.status_code}
     except Exception as e:
         return {'ok': False, 'error': str(e)}
@@ -74,7 +86,7 @@ def check_ai():
         return {'ok': False, 'error': 'AI secrets missing'}
     # 仅进行基本可达性检测
     try:
-        r = requests.get(base, timeout=10)
+        r = SESSION.get(base, timeout=10)
         return {'ok': r.status_code in (200, 403, 404), 'status': r.status_code}
     except Exception as e:
         return {'ok': False, 'error': str(e)}
@@ -95,14 +107,40 @@ def check_email():
         return {'ok': False, 'error': str(e)}
 
 
-def main():
-    report = {
-        'missing_secrets': check_presence(),
-        'notion': check_notion(),
-        'github': check_github(),
-        'ai': check_ai(),
-        'email': check_email(),
+def timing_targets():
+    """各服务用于计时的端点（缺少配置的服务不计时）。"""
+    targets = {
+        'notion': 'https://api.notion.com/v1/users/me',
+        'github': 'https://api.github.com/',
     }
+    if os.getenv('AI_BASE_URL'):
+        targets['ai'] = os.getenv('AI_BASE_URL')
+    if os.getenv('EMAIL_SMTP_SERVER'):
+        port = os.getenv('EMAIL_SMTP_PORT') or '587'
+        scheme = 'smtps' if port == '465' else 'smtp'
+        targets['email'] = f"{scheme}://{os.getenv('EMAIL_SMTP_SERVER')}:{port}"
+    return targets
+
+
+def run_checks(timeout=PROBE_TIMEOUT):
+    """并发执行所有检测与计时，返回 {服务: 结果}，结果中附带 timing。"""
+    checks = {'notion': check_notion, 'github': check_github, 'ai': check_ai, 'email': check_email}
+    probes = dict(checks)
+    for name, url in timing_targets().items():
+        probes[f'{name}:timing'] = (lambda u=url: {'ok': True, 'timing': measure_endpoint(u, timeout=10)})
+    results = run_probes(probes, timeout=timeout)
+    report = {}
+    for name in checks:
+        entry = results[name]
+        timed = results.get(f'{name}:timing')
+        if timed:
+            entry['timing'] = timed.get('timing') or {'error': timed.get('error')}
+        report[name] = entry
+    return report
+
+
+def main():
+    report = {'missing_secrets': check_presence(), **run_checks()}
     print(json.dumps(report, ensure_ascii=False, indent=2))
     # 若有缺失或关键检查失败，退出非零码以便 Actions 标红
     if report['missing_secrets']:
@@ -5,28 +5,46 @@ Run with: python automation/workflows/csv_notion_migration.py --config automatio
 from __future__ import annotations
 import argparse
 import csv
+import gzip
 import hashlib
+import io
+import itertools
 import json
 import os
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Any
-import requests
+from typing import Any, Callable, Dict, Iterator, List, Tuple
 
-from automation.utils.migration_mapping import get_mapping
+from automation.utils.migration_mapping import get_mapping, get_relation_target, get_unique_key_fields
 from automation.utils.normalization import (
     parse_date,
     normalize_priority,
     normalize_status,
     split_multi,
     coerce_number,
+    decode_url,
     build_title,
     build_rich,
 )
-from automation.utils.relation_resolver import build_relation_resolver
+from automation.utils.relation_resolver import build_relation_resolver, normalize_title
+from automation.utils.notion_api import NOTION_API, RateLimiter, ordered_map, request_with_retry
 
 NOTION_VERSION = "2022-06-28"
+PROGRESS_EVERY_BYTES = 8 * 1024 * 1024
+# Values that clear a property on PATCH, sent when an updated row's cell became empty.
+# Titles are never cleared.
+EMPTY_PROPERTY_VALUES: Dict[str, Any] = {
+    "rich_text": {"rich_text": []},
+    "date": {"date": None},
+    "select": {"select": None},
+    "multi_select": {"multi_select": []},
+    "number": {"number": None},
+    "url": {"url": None},
+    "relation": {"relation": []},
+}
 
 class MigrationContext:
     def __init__(self, config: Dict[str, Any], dry_run: bool, resume: bool):
@@ -37,23 +55,99 @@ class MigrationContext:
         if not self.token:
             print("[WARN] NOTION_TOKEN environment variable is empty.")
         self.id_map_path = Path(config["id_map_file"]) if config.get("id_map_file") else Path("automation/utils/notion_id_map.json")
+        # Append-only write-ahead journal of (kind, ukey, page_id); compacted into the snapshot at the end
+        self.journal_path = self.id_map_path.with_suffix(".journal")
+        self._journal = None
+        self._journal_pending = 0
+        self._journal_lock = threading.Lock()
+        # kind -> ukey -> content hash of the row as last imported
+        self.content_hashes: Dict[str, Dict[str, str]] = {}
         self.id_map: Dict[str, Dict[str, str]] = self._load_id_map()
-        self.relation_cache_path = config.get("cache_file", "automation/utils/notion_relation_cache.json")
-        self.relation_resolver = build_relation_resolver(self.token, self.relation_cache_path)
         self.batch_size = config.get("batch_size", 6)
+        retry = config.get("retry", {})
+        self.max_attempts = retry.get("max_attempts", 3)
+        self.base_sleep = retry.get("base_sleep_seconds", 2)
+        self.concurrency = max(1, int(config.get("concurrency", 3)))
+        self.limiter = RateLimiter(config.get("rate_limit_per_sec", 3))
+        self.relation_cache_path = config.get("cache_file", "automation/utils/notion_relation_cache.json")
+        self.relation_resolver = build_relation_resolver(
+            self.token, self.relation_cache_path, limiter=self.limiter,
+            max_attempts=self.max_attempts, base_sleep=self.base_sleep,
+        )
+        # Per-row outcome: kind -> list of {"key", "page_id" | "error"}
+        self.results: Dict[str, List[Dict[str, str]]] = {}
 
     def _load_id_map(self) -> Dict[str, Dict[str, str]]:
+        """Load the snapshot, then replay the journal tail left by an interrupted run."""
+        id_map: Dict[str, Dict[str, str]] = {}
         if self.id_map_path.exists():
             try:
-                return json.loads(self.id_map_path.read_text(encoding="utf-8"))
+                data = json.loads(self.id_map_path.read_text(encoding="utf-8"))
             except Exception:
-                return {}
-        return {}
+                data = {}
+            if "pages" in data:
+                id_map = data["pages"]
+                self.content_hashes = data.get("hashes", {})
+            else:
+                id_map = data  # legacy snapshot: {kind: {ukey: page_id}}
+        if self.journal_path.exists():
+            replayed = 0
+            raw = self.journal_path.read_bytes()
+            complete = raw[: raw.rfind(b"\n") + 1]
+            if len(complete) != len(raw):
+                # drop the torn last line from a crash, so the next append starts on a fresh line
+                with self.journal_path.open("r+b") as f:
+                    f.truncate(len(complete))
+            for line in complete.decode("utf-8", errors="replace").splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                id_map.setdefault(entry["kind"], {})[entry["ukey"]] = entry["page_id"]
+                if entry.get("hash"):
+                    self.content_hashes.setdefault(entry["kind"], {})[entry["ukey"]] = entry["hash"]
+                replayed += 1
+            print(f"[INFO] replayed {replayed} id_map journal entries")
+        return id_map
+
+    def record(self, kind: str, ukey: str, page_id: str, content_hash: str = ""):
+        """Record an imported row and append it to the journal (fsync'd every batch_size rows)."""
+        with self._journal_lock:
+            self.id_map.setdefault(kind, {})[ukey] = page_id
+            if content_hash:
+                self.content_hashes.setdefault(kind, {})[ukey] = content_hash
+            if self._journal is None:
+                self._journal = self.journal_path.open("a", encoding="utf-8")
+            entry = {"kind": kind, "ukey": ukey, "page_id": page_id, "hash": content_hash}
+            self._journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._journal_pending += 1
+            if self._journal_pending >= self.batch_size:
+                self._sync_journal()
+
+    def _sync_journal(self):
+        if self._journal is not None:
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+        self._journal_pending = 0
 
     def save_id_map(self):
-        tmp = self.id_map_path.with_suffix(".tmp")
-        tmp.write_text(json.dumps(self.id_map, ensure_ascii=False, indent=2), encoding="utf-8")
-        tmp.replace(self.id_map_path)
+        """Checkpoint: make journal entries written since the last checkpoint durable."""
+        with self._journal_lock:
+            self._sync_journal()
+
+    def compact(self):
+        """Fold the journal into the snapshot (temp file + replace) and truncate it."""
+        with self._journal_lock:
+            self._sync_journal()
+            tmp = self.id_map_path.with_suffix(".tmp")
+            snapshot = {"pages": self.id_map, "hashes": self.content_hashes}
+            tmp.write_text(json.dumps(snapshot, ensure_ascii=False, indent=2), encoding="utf-8")
+            tmp.replace(self.id_map_path)
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            if self.journal_path.exists():
+                self.journal_path.unlink()
         self.relation_resolver.save()
 
     def headers(self) -> Dict[str, str]:
@@ -74,64 +168,216 @@ class BaseImporter:
             raise ValueError(f"Missing database id for {db_id_key}")
         self.mapping = get_mapping(mapping_key)
         self.kind = mapping_key
+        self.key_fields: List[str] = ctx.config.get("unique_keys", {}).get(mapping_key) or get_unique_key_fields(mapping_key)
+        self._claimed_legacy: set = set()
+        self._converters = None
 
     def unique_key(self, row: Dict[str, str]) -> str:
-        seed = row.get(next(iter(row)), "") + "|" + self.kind
+        """Stable row identity from the configured key columns (falls back to the first column)."""
+        fields = [f for f in self.key_fields if f in row] or [next(iter(row), "")]
+        seed = "|".join(row.get(f, "") for f in fields) + "|" + self.kind
         return hashlib.sha256(seed.encode("utf-8")).hexdigest()[:16]
 
-    def already_imported(self, key: str) -> bool:
-        return key in self.ctx.id_map.get(self.kind, {}) if self.ctx.resume else False
+    def legacy_key(self, row: Dict[str, str]) -> str:
+        """Key scheme of earlier runs: first column value + kind."""
+        seed = row.get(next(iter(row), ""), "") + "|" + self.kind
+        return hashlib.sha256(seed.encode("utf-8")).hexdigest()[:16]
 
-    def load_csv(self, path: Path) -> List[Dict[str, str]]:
-        rows: List[Dict[str, str]] = []
-        with path.open("r", encoding="utf-8-sig") as f:
-            reader = csv.DictReader(f)
+    def content_hash(self, row: Dict[str, str]) -> str:
+        """Hash of every migrated column, used to detect edited rows on --resume."""
+        seed = "\x1f".join(row.get(src, "") for src in self.mapping)
+        return hashlib.sha256(seed.encode("utf-8")).hexdigest()[:16]
+
+    def classify(self, row: Dict[str, str], ukey: str, chash: str) -> Tuple[str, str]:
+        """Return ("create" | "update" | "skip", existing page id) for a row under --resume."""
+        if not self.ctx.resume:
+            return "create", ""
+        pages = self.ctx.id_map.get(self.kind, {})
+        page_id = pages.get(ukey)
+        if not page_id:
+            legacy = self.legacy_key(row)
+            if legacy in pages and legacy not in self._claimed_legacy:
+                # Adopt the entry written under the old key scheme; its content is unknown,
+                # so it is assumed unchanged and re-keyed with the current hash.
+                self._claimed_legacy.add(legacy)
+                self.ctx.record(self.kind, ukey, pages[legacy], chash)
+                return "skip", pages[legacy]
+            return "create", ""
+        previous = self.ctx.content_hashes.get(self.kind, {}).get(ukey)
+        if previous is None:
+            self.ctx.record(self.kind, ukey, page_id, chash)
+            return "skip", page_id
+        return ("skip" if previous == chash else "update"), page_id
+
+    def iter_rows(self, path: Path) -> Iterator[Dict[str, str]]:
+        """Stream rows of a CSV (or .csv.gz) file; header names are normalized once per file."""
+        total = path.stat().st_size
+        with path.open("rb") as raw:
+            stream = gzip.GzipFile(fileobj=raw) if path.suffix.lower() == ".gz" else raw
+            text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+            reader = csv.reader(text)
+            header = [h.strip() for h in next(reader, [])]
+            next_report = PROGRESS_EVERY_BYTES
             for r in reader:
-                rows.append({k.strip(): (v.strip() if isinstance(v, str) else v) for k, v in r.items()})
-        return rows
+                yield dict(zip(header, (v.strip() for v in r)))
+                pos = raw.tell()
+                if pos >= next_report:
+                    print(f"[INFO] {path.name}: {pos / total:.0%} ({pos >> 20}/{total >> 20} MB)")
+                    next_report = pos + PROGRESS_EVERY_BYTES
 
-    def transform_row(self, row: Dict[str, str]) -> Dict[str, Any]:
-        props: Dict[str, Any] = {}
-        for src, (target, ptype) in self.mapping.items():
-            raw = row.get(src, "")
-            if ptype == "title":
-                props[target] = build_title(raw)
-            elif ptype == "rich_text":
-                props[target] = build_rich(raw)
-            elif ptype == "date":
+    def load_csv(self, path: Path) -> List[Dict[str, str]]:
+        return list(self.iter_rows(path))
+
+    def iter_payloads(self, path: Path) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Lazily yield (unique key, upload job) for new or changed rows.
+
+        A job is {"action": "create" | "update", "page_id", "hash", "payload"}.
+        """
+        for row in self.iter_rows(path):
+            ukey = self.unique_key(row)
+            chash = self.content_hash(row)
+            action, page_id = self.classify(row, ukey, chash)
+            if action == "skip":
+                continue
+            props = self.transform_row(row, clear_empty=action == "update")
+            if not props:
+                continue
+            payload = self.build_payload(props) if action == "create" else {"properties": props}
+            yield ukey, {"action": action, "page_id": page_id, "hash": chash, "payload": payload}
+
+    def _compile_converter(self, ptype: str) -> Callable[[str], Any]:
+        """Return a converter raw cell -> Notion property value (None to omit the property)."""
+        if ptype == "title":
+            return build_title
+        if ptype == "rich_text":
+            return build_rich
+        if ptype == "date":
+            def convert_date(raw: str):
                 iso = parse_date(raw)
-                if iso:
-                    props[target] = {"date": {"start": iso}}
-            elif ptype == "select":
-                if raw:
-                    props[target] = {"select": {"name": raw}}
-            elif ptype == "multi_select":
+                return {"date": {"start": iso}} if iso else None
+            return convert_date
+        if ptype == "select":
+            return lambda raw: {"select": {"name": raw}} if raw else None
+        if ptype == "multi_select":
+            def convert_multi(raw: str):
                 vals = split_multi(raw)
-                if vals:
-                    props[target] = {"multi_select": [{"name": v} for v in vals]}
-            elif ptype == "number":
+                return {"multi_select": [{"name": v} for v in vals]} if vals else None
+            return convert_multi
+        if ptype == "number":
+            def convert_number(raw: str):
                 num = coerce_number(raw)
-                if num is not None:
-                    props[target] = {"number": num}
-            elif ptype == "url":
-                if raw:
-                    props[target] = {"url": raw}
-            elif ptype == "relation":
-                # relation expects a page id; fallback skip if not resolvable
-                if raw:
-                    title_guess = self._extract_title_from_relation(raw)
-                    rel_id = self.ctx.relation_resolver.ensure(title_guess, self.ctx.config.get("knowledge_db_id"))
-                    if rel_id:
-                        props[target] = {"relation": [{"id": rel_id}]}
+                return {"number": num} if num is not None else None
+            return convert_number
+        if ptype == "url":
+            return lambda raw: {"url": raw} if raw else None
+        if ptype == "relation":
+            resolver = self.ctx.relation_resolver
+            dry_run = self.ctx.dry_run
+
+            def convert_relation(raw: str):
+                # relation expects a page id; targets are prefetched per run, fallback skip if not resolvable
+                if not raw:
+                    return None
+                title_guess = self._extract_title_from_relation(raw)
+                rel_id = resolver.lookup(title_guess, self.relation_db_id)
+                if not rel_id and not dry_run:
+                    rel_id = resolver.ensure(title_guess, self.relation_db_id)
+                return {"relation": [{"id": rel_id}]} if rel_id else None
+            return convert_relation
+        return lambda raw: None
+
+    @property
+    def converters(self) -> List[Tuple[str, str, Callable[[str], Any], Any]]:
+        """(source column, target property, converter, clearing value) compiled once per importer."""
+        if self._converters is None:
+            self._converters = [
+                (src, target, self._compile_converter(ptype), EMPTY_PROPERTY_VALUES.get(ptype))
+                for src, (target, ptype) in self.mapping.items()
+            ]
+        return self._converters
+
+    def transform_row(self, row: Dict[str, str], clear_empty: bool = False) -> Dict[str, Any]:
+        """Row -> Notion properties; with clear_empty, emptied cells (column present) clear the property."""
+        props: Dict[str, Any] = {}
+        for src, target, convert, empty in self.converters:
+            raw = row.get(src, "")
+            value = convert(raw)
+            if value is not None:
+                props[target] = value
+            elif clear_empty and empty is not None and src in row and not raw:
+                props[target] = empty
         return props
 
     def _extract_title_from_relation(self, raw: str) -> str:
         # Attempt decode URL component then split last path-like segment
-        from urllib.parse import unquote
-        decoded = unquote(raw)
+        decoded = decode_url(raw)
         # Remove extension .csv or .md if present
         return decoded.rsplit(" ", 1)[0].split("/")[-1].replace(".csv", "").replace(".md", "")
 
+    @property
+    def relation_db_id(self) -> str:
+        return self.ctx.config.get(f"{get_relation_target(self.kind) or 'knowledge'}_db_id", "")
+
+    def estimate_action(self, row: Dict[str, str]) -> str:
+        """Side-effect-free counterpart of classify() used by the planner."""
+        if not self.ctx.resume:
+            return "create"
+        pages = self.ctx.id_map.get(self.kind, {})
+        ukey = self.unique_key(row)
+        if ukey not in pages:
+            return "skip" if self.legacy_key(row) in pages else "create"
+        previous = self.ctx.content_hashes.get(self.kind, {}).get(ukey)
+        return "update" if previous is not None and previous != self.content_hash(row) else "skip"
+
+    def plan_files(self, files: List[Path], limit: int = None) -> Dict[str, Any]:
+        """Scan files without any API call and count the work a run would do."""
+        columns = [src for src, (_, ptype) in self.mapping.items() if ptype == "relation"]
+        title_col = next((src for src, (_, ptype) in self.mapping.items() if ptype == "title"), None)
+        counts = {"create": 0, "update": 0, "skip": 0}
+        titles, row_titles = set(), set()
+        for file in files:
+            for row in self.iter_rows(file):
+                if title_col and row.get(title_col):
+                    row_titles.add(normalize_title(row[title_col]))
+                action = self.estimate_action(row)
+                if action != "skip" and limit and counts["create"] + counts["update"] >= limit:
+                    action = "skip"
+                counts[action] += 1
+                if action == "skip":
+                    continue
+                for col in columns:
+                    if row.get(col):
+                        titles.add(normalize_title(self._extract_title_from_relation(row[col])))
+        titles.discard("")
+        return {
+            "kind": self.kind,
+            "files": len(files),
+            "rows": sum(counts.values()),
+            **counts,
+            "relation_titles": titles,
+            "row_titles": row_titles,
+        }
+
+    def prefetch_relations(self, files: List[Path]):
+        """Resolve every relation title referenced by files before upload.
+
+        One paginated query indexes the target database; the distinct misses across
+        all files are then created in a single concurrent batch.
+        """
+        columns = [src for src, (_, ptype) in self.mapping.items() if ptype == "relation"]
+        if not columns:
+            return
+        hashes = self.ctx.content_hashes.get(self.kind, {}) if self.ctx.resume else {}
+        titles = set()
+        for file in files:
+            for row in self.iter_rows(file):
+                if hashes and hashes.get(self.unique_key(row)) == self.content_hash(row):
+                    continue  # unchanged on resume, will be skipped
+                for col in columns:
+                    if row.get(col):
+                        titles.add(self._extract_title_from_relation(row[col]))
+        self.ctx.relation_resolver.prefetch(titles, self.relation_db_id, self.ctx.concurrency, self.ctx.dry_run)
+
     def build_payload(self, props: Dict[str, Any]) -> Dict[str, Any]:
         return {
             "parent": {"database_id": self.db_id},
@@ -142,35 +388,81 @@ class BaseImporter:
         if self.ctx.dry_run:
             print(json.dumps(payload, ensure_ascii=False)[:400] + "... [dry-run]")
             return "dry-run-id"
-        r = requests.post("https://api.notion.com/v1/pages", headers=self.ctx.headers(), json=payload, timeout=30)
-        if r.status_code == 200:
+        r = request_with_retry(
+            "POST", f"{NOTION_API}/pages", self.ctx.token, payload,
+            limiter=self.ctx.limiter, timeout=30,
+            max_attempts=self.ctx.max_attempts, base_sleep=self.ctx.base_sleep,
+        )
+        if r is not None and r.status_code == 200:
             return r.json().get("id", "")
-        print(f"[ERROR] create_page status={r.status_code} body={r.text[:300]}")
+        if r is not None:
+            print(f"[ERROR] create_page status={r.status_code} body={r.text[:300]}")
+        else:
+            print("[ERROR] create_page no response (network/retry exceeded)")
         return ""
 
-    def run_files(self, files: List[Path], limit: int = None):
+    def update_page(self, page_id: str, payload: Dict[str, Any]) -> str:
+        if self.ctx.dry_run:
+            print(json.dumps({"id": page_id, **payload}, ensure_ascii=False)[:400] + "... [dry-run update]")
+            return page_id
+        r = request_with_retry(
+            "PATCH", f"{NOTION_API}/pages/{page_id}", self.ctx.token, payload,
+            limiter=self.ctx.limiter, timeout=30,
+            max_attempts=self.ctx.max_attempts, base_sleep=self.ctx.base_sleep,
+        )
+        if r is not None and r.status_code == 200:
+            return page_id
+        if r is not None:
+            print(f"[ERROR] update_page id={page_id} status={r.status_code} body={r.text[:300]}")
+        else:
+            print(f"[ERROR] update_page id={page_id} no response (network/retry exceeded)")
+        return ""
+
+    def upload(self, job: Dict[str, Any]) -> str:
+        if job["action"] == "update":
+            return self.update_page(job["page_id"], job["payload"])
+        return self.create_page(job["payload"])
+
+    def run_files(self, files: List[Path], limit: int = None, fail_fast: bool = False):
+        """Upload rows through a bounded, rate-limited worker pool.
+
+        Results are consumed in row order, so id_map entries are recorded in the same
+        order as the source CSV. With fail_fast, the first failed row stops submission
+        and raises after queued requests are cancelled and in-flight ones are recorded.
+        """
         imported = 0
-        for file in files:
-            rows = self.load_csv(file)
-            for row in rows:
-                ukey = self.unique_key(row)
-                if self.already_imported(ukey):
-                    continue
-                props = self.transform_row(row)
-                if not props:
-                    continue
-                page_id = self.create_page(self.build_payload(props))
-                if page_id:
-                    self.ctx.id_map.setdefault(self.kind, {})[ukey] = page_id
-                imported += 1
+        results = self.ctx.results.setdefault(self.kind, [])
+        upload = lambda item: self.upload(item[1])
+
+        def finish(item, page_id: str):
+            ukey, job = item
+            if page_id:
+                self.ctx.record(self.kind, ukey, page_id, job["hash"])
+                results.append({"key": ukey, "action": job["action"], "page_id": page_id})
+            else:
+                results.append({"key": ukey, "action": job["action"], "error": f"{job['action']} failed"})
+
+        self.prefetch_relations(files)
+        with ThreadPoolExecutor(max_workers=self.ctx.concurrency) as pool:
+            for file in files:
+                jobs = self.iter_payloads(file)
+                if limit:
+                    jobs = itertools.islice(jobs, max(0, limit - imported))
+                stream = ordered_map(upload, jobs, pool, self.ctx.concurrency * 2, on_abandon=finish)
+                for (ukey, job), page_id in stream:
+                    imported += 1
+                    finish((ukey, job), page_id)
+                    if not page_id and fail_fast:
+                        # wait for uploads already running so their page ids are recorded before --resume
+                        stream.close()
+                        self.ctx.save_id_map()
+                        raise RuntimeError(f"{job['action']} failed for row key={ukey}")
                 if limit and imported >= limit:
                     break
-            if limit and imported >= limit:
-                break
-            # Batch flush
-            if imported % self.ctx.batch_size == 0:
-                self.ctx.save_id_map()
         self.ctx.save_id_map()
+        failed = sum(1 for r in results if "error" in r)
+        updated = sum(1 for r in results if r.get("action") == "update" and "error" not in r)
+        print(f"[INFO] kind={self.kind} attempted={len(results)} created={len(results) - failed - updated} updated={updated} failed={failed}")
 
 class KnowledgeImporter(BaseImporter):
     KIND = "knowledge"
@@ -188,6 +480,105 @@ IMPORTER_CLASSES = {
 }
 
 
+def discover_files(kind: str, source_path: Path) -> List[Path]:
+    pattern = "*all.csv" if kind in ("knowledge", "tasks", "resources") else "*.csv"
+    return sorted(source_path.rglob(pattern)) + sorted(source_path.rglob(pattern + ".gz"))
+
+
+def topo_levels(deps: Dict[str, List[str]]) -> List[List[str]]:
+    """Group kinds into levels; every kind comes after the kinds it depends on.
+
+    Kinds within one level are independent and may run in parallel.
+    """
+    remaining = {k: set(v) & set(deps) for k, v in deps.items()}
+    levels: List[List[str]] = []
+    while remaining:
+        ready = [k for k, v in remaining.items() if not v]
+        if not ready:
+            raise ValueError(f"dependency cycle between kinds: {sorted(remaining)}")
+        levels.append(ready)
+        for k in ready:
+            del remaining[k]
+        for v in remaining.values():
+            v.difference_update(ready)
+    return levels
+
+
+def build_plan(ctx: MigrationContext, kinds: List[str], source_path: Path, limit: int = None) -> Dict[str, Dict[str, Any]]:
+    """Phase 1: scan every source CSV and estimate API cost per kind, without network calls."""
+    plan: Dict[str, Dict[str, Any]] = {}
+    for kind in kinds:
+        imp_cls = IMPORTER_CLASSES.get(kind)
+        if not imp_cls:
+            print(f"[WARN] unsupported kind: {kind}")
+            continue
+        importer = imp_cls(ctx, f"{kind}_db_id", kind)
+        files = discover_files(kind, source_path)
+        entry = importer.plan_files(files, limit)
+        entry.update(importer=importer, paths=files)
+        plan[kind] = entry
+    for kind, entry in plan.items():
+        target = get_relation_target(kind)
+        entry["depends_on"] = [target] if target in plan and target != kind else []
+        # Titles neither cached nor imported by the target kind in this run become placeholder pages
+        target_titles = plan[target]["row_titles"] if entry["depends_on"] else set()
+        relation_db = entry["importer"].relation_db_id
+        entry["relation_misses"] = sum(
+            1 for t in entry["relation_titles"]
+            if not ctx.relation_resolver.lookup(t, relation_db) and t not in target_titles
+        )
+        # writes + placeholder creations + at least one paginated index query
+        entry["requests"] = entry["create"] + entry["update"] + entry["relation_misses"] + (1 if entry["relation_titles"] else 0)
+    return plan
+
+
+def print_plan(ctx: MigrationContext, plan: Dict[str, Dict[str, Any]], levels: List[List[str]]):
+    rate = ctx.config.get("rate_limit_per_sec", 3) or 3
+    for i, level in enumerate(levels, 1):
+        print(f"[PLAN] level {i}: {', '.join(level)}")
+        for kind in level:
+            e = plan[kind]
+            print(
+                f"[PLAN]   kind={kind} files={e['files']} rows={e['rows']} create={e['create']} "
+                f"update={e['update']} skip={e['skip']} relation_titles={len(e['relation_titles'])} "
+                f"relation_misses={e['relation_misses']} depends_on={','.join(e['depends_on']) or '-'} "
+                f"requests≈{e['requests']}"
+            )
+    total = sum(e["requests"] for e in plan.values())
+    print(f"[PLAN] total requests≈{total} est_duration≈{total / rate:.0f}s at {rate} req/s")
+
+
+def execute_plan(ctx: MigrationContext, plan: Dict[str, Dict[str, Any]], levels: List[List[str]],
+                 limit: int = None, fail_fast: bool = False) -> int:
+    """Phase 2: run kinds level by level, independent kinds of a level in parallel. Returns error count."""
+    targets = {get_relation_target(k) for k in plan}
+
+    def run_kind(kind: str) -> int:
+        entry = plan[kind]
+        print(f"[INFO] kind={kind} files={entry['files']} dry_run={ctx.dry_run}")
+        try:
+            entry["importer"].run_files(entry["paths"], limit=limit, fail_fast=fail_fast)
+        except Exception as e:
+            print(f"[ERROR] kind={kind} unexpected exception: {e}")
+            return 1
+        finally:
+            if kind in targets:
+                # dependents must see the pages just imported when they index this database
+                ctx.relation_resolver.invalidate(ctx.config.get(f"{kind}_db_id", ""))
+        return 0
+
+    errors = 0
+    for level in levels:
+        if len(level) == 1:
+            errors += run_kind(level[0])
+        else:
+            with ThreadPoolExecutor(max_workers=len(level)) as pool:
+                errors += sum(pool.map(run_kind, level))
+        if errors and fail_fast:
+            break
+    return errors
+
+
 def parse_args(argv=None):
     p = argparse.ArgumentParser(description="CSV → Notion migration")
     p.add_argument("--config", required=True, help="Path to config json")
@@ -195,6 +586,7 @@ def parse_args(argv=None):
     p.add_argument("--only", help="Comma list: knowledge,tasks,resources")
     p.add_argument("--dry-run", action="store_true")
     p.add_argument("--resume", action="store_true")
+    p.add_argument("--plan", action="store_true", help="Only print the dependency-ordered plan and API cost estimate")
     p.add_argument("--limit", type=int, help="Limit total imported rows")
     p.add_argument("--fail-fast", action="store_true", help="Stop on first error")
     p.add_argument("--seed-review", action="store_true", help="Create initial review cards after knowledge import")
@@ -210,41 +602,88 @@ def main(argv=None):
     if not source_path.exists():
         print(f"[ERROR] source path not found: {source_path}")
         return 1
-    errors = 0
-    for kind in kinds:
-        imp_cls = IMPORTER_CLASSES.get(kind)
-        if not imp_cls:
-            print(f"[WARN] unsupported kind: {kind}")
-            continue
-        importer = imp_cls(ctx, f"{kind}_db_id", kind)
-        pattern = "*all.csv" if kind in ("knowledge", "tasks", "resources") else "*.csv"
-        files = list(source_path.rglob(pattern))
-        print(f"[INFO] kind={kind} files={len(files)} dry_run={ctx.dry_run}")
-        try:
-            importer.run_files(files, limit=args.limit)
-        except Exception as e:
-            errors += 1
-            print(f"[ERROR] kind={kind} unexpected exception: {e}")
-            if args.fail_fast:
-                break
+    plan = build_plan(ctx, kinds, source_path, limit=args.limit)
+    levels = topo_levels({kind: entry["depends_on"] for kind, entry in plan.items()})
+    print_plan(ctx, plan, levels)
+    if args.plan:
+        return 0
+    try:
+        errors = execute_plan(ctx, plan, levels, limit=args.limit, fail_fast=args.fail_fast)
+    finally:
+        ctx.compact()
     if args.seed_review and "knowledge" in kinds:
         seed_review_cards(ctx)
     print(f"[DONE] migration finished errors={errors}")
     return 0
 
 
+def iter_database_pages(ctx: MigrationContext, db_id: str) -> Iterator[Dict[str, Any]]:
+    """Yield every page of a database (paginated query, 100 per request).
+
+    Raises RuntimeError when a request fails, so callers never mistake a partial
+    listing for the complete database.
+    """
+    body: Dict[str, Any] = {"page_size": 100}
+    while True:
+        r = request_with_retry(
+            "POST", f"{NOTION_API}/databases/{db_id}/query", ctx.token, body,
+            limiter=ctx.limiter, max_attempts=ctx.max_attempts, base_sleep=ctx.base_sleep,
+        )
+        if r is None or r.status_code != 200:
+            status = r.status_code if r is not None else "no response"
+            raise RuntimeError(f"query database failed db={db_id} status={status}")
+        data = r.json()
+        yield from data.get("results", [])
+        if not data.get("has_more"):
+            return
+        body["start_cursor"] = data.get("next_cursor")
+
+
+def _page_title(page: Dict[str, Any]) -> str:
+    for prop in page.get("properties", {}).values():
+        if prop.get("type") == "title":
+            return "".join(t.get("plain_text", "") for t in prop.get("title", []))
+    return ""
+
+
 def seed_review_cards(ctx: MigrationContext):
-    """Create initial review cards (Stage 0) for each imported knowledge page if review db provided."""
+    """Create initial review cards (Stage 0) for imported knowledge pages that have none yet.
+
+    Existing cards' 关联知识点 relations and the knowledge page titles are each loaded
+    with one paginated query; missing cards go through the bounded, rate-limited pool.
+    """
     review_db = ctx.config.get("review_db_id")
     if not review_db:
         print("[INFO] seed_review skipped: missing review_db_id")
         return
     knowledge_entries = ctx.id_map.get("knowledge", {})
-    print(f"[INFO] Seeding review cards for {len(knowledge_entries)} knowledge items")
+    seeded = set()
+    titles: Dict[str, str] = {}
+    knowledge_db = ctx.config.get("knowledge_db_id")
+    # a dry run previews without querying Notion: every knowledge entry counts as unseeded
+    if not ctx.dry_run:
+        try:
+            for card in iter_database_pages(ctx, review_db):
+                rel = card.get("properties", {}).get("关联知识点", {}).get("relation", [])
+                seeded.update(r.get("id", "").replace("-", "") for r in rel)
+            if knowledge_db:
+                for page in iter_database_pages(ctx, knowledge_db):
+                    titles[page.get("id", "").replace("-", "")] = _page_title(page)
+        except RuntimeError as e:
+            # without the complete list of existing cards every knowledge page would look unseeded
+            print(f"[ERROR] seed_review skipped: {e}")
+            return
+    pending = [
+        (ukey, page_id) for ukey, page_id in knowledge_entries.items()
+        if page_id.replace("-", "") not in seeded
+    ]
+    print(f"[INFO] Seeding review cards: knowledge={len(knowledge_entries)} existing={len(knowledge_entries) - len(pending)} to_create={len(pending)}")
     today = time.strftime("%Y-%m-%d")
-    for ukey, page_id in knowledge_entries.items():
+
+    def create_card(item: Tuple[str, str]) -> bool:
+        ukey, page_id = item
         props = {
-            "卡片标题": {"title": [{"text": {"content": ukey}}]},
+            "卡片标题": {"title": [{"text": {"content": titles.get(page_id.replace("-", "")) or ukey}}]},
             "关联知识点": {"relation": [{"id": page_id}]},
             "阶段 Stage": {"number": 0},
             "Ease": {"number": ctx.config.get("default_ease", 2.5)},
@@ -256,10 +695,22 @@ def seed_review_cards(ctx: MigrationContext):
         payload = {"parent": {"database_id": review_db}, "properties": props}
         if ctx.dry_run:
             print(json.dumps(payload, ensure_ascii=False)[:200] + "... [dry-run review]")
-            continue
-        r = requests.post("https://api.notion.com/v1/pages", headers=ctx.headers(), json=payload, timeout=30)
-        if r.status_code != 200:
-            print(f"[WARN] failed seeding review card status={r.status_code}")
+            return True
+        r = request_with_retry(
+            "POST", f"{NOTION_API}/pages", ctx.token, payload,
+            limiter=ctx.limiter, max_attempts=ctx.max_attempts, base_sleep=ctx.base_sleep,
+        )
+        if r is None or r.status_code != 200:
+            status = r.status_code if r is not None else "no response"
+            print(f"[WARN] failed seeding review card page={page_id} status={status}")
+            return False
+        return True
+
+    created = 0
+    with ThreadPoolExecutor(max_workers=ctx.concurrency) as pool:
+        for _, ok in ordered_map(create_card, pending, pool, ctx.concurrency * 2):
+            created += ok
+    print(f"[INFO] review cards created={created} failed={len(pending) - created}")
 
 if __name__ == "__main__":
     sys.exit(main())
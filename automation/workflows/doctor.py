@@ -4,7 +4,7 @@
 Checks:
 - Load .env and config
 - Validate NOTION_TOKEN and NOTION_REVIEW_DB_ID
-- Query Notion to verify access
+- Query Notion to verify access (concurrent probes with DNS/connect/TLS/TTFB timings)
 - Optionally ensure required DB properties exist
 - Optionally initialize seed cards
 - Finally run review scheduler in dry-run to validate end-to-end
@@ -18,7 +18,6 @@ import os, sys, json
 from pathlib import Path
 from typing import Any, Dict, List, Tuple
 import argparse
-import requests
 
 # Ensure project root on sys.path
 _CUR = Path(__file__).resolve().parent
@@ -44,6 +43,8 @@ from automation.workflows.init_review_cards import (
     create_page,
 )
 from automation.workflows import review_scheduler as rs
+from automation.utils.diagnostics import measure_endpoint, render_timing_table, run_probes
+from automation.utils.notion_api import NOTION_API, request_with_retry
 
 NOTION_VERSION = "2022-06-28"
 
@@ -73,6 +74,7 @@ def parse_args(argv=None):
     p.add_argument("--dry-run", action="store_true", help="Do not modify Notion (applies to init and scheduler)")
     p.add_argument("--max", type=int, default=5, help="Max cards to process in scheduler validation")
     p.add_argument("--report", help="Write an HTML report to this path")
+    p.add_argument("--probe-timeout", type=float, default=30.0, help="Per-probe timeout in seconds for connectivity checks")
     p.add_argument("--full", action="store_true", help="Run full chain: scheduler with stats+dashboard+backup (respects --dry-run)")
     return p.parse_args(argv)
 
@@ -92,20 +94,39 @@ def assert_token_and_db() -> tuple[str, str]:
     return token, db_id
 
 
-def sanity_query(token: str, db_id: str, attempts: int = 3) -> Tuple[bool, str]:
-    import time
-    url = f"https://api.notion.com/v1/databases/{db_id}/query"
-    last = ""
-    for i in range(1, attempts + 1):
-        try:
-            r = requests.post(url, headers=headers(token), json={"page_size": 1}, timeout=40)
-            if r.status_code == 200:
-                return True, "OK"
-            last = f"status={r.status_code} body={r.text[:240]}"
-        except Exception as e:
-            last = repr(e)
-        time.sleep(2 ** (i - 1))
-    return False, last
+def sanity_query(token: str, db_id: str, attempts: int = 3, budget: float = 60.0) -> Tuple[bool, str]:
+    """Query one page; per-attempt timeouts plus backoff stay within `budget` seconds."""
+    base_sleep = 1.0
+    backoff = sum(base_sleep * 2 ** i for i in range(attempts - 1))
+    per_attempt = max(1.0, (budget - backoff) / attempts)
+    r = request_with_retry("POST", f"{NOTION_API}/databases/{db_id}/query", token, {"page_size": 1},
+                           timeout=per_attempt, max_attempts=attempts, base_sleep=base_sleep)
+    if r is None:
+        return False, "no response (network/retry exceeded)"
+    if r.status_code == 200:
+        return True, "OK"
+    return False, f"status={r.status_code} body={r.text[:240]}"
+
+
+def connectivity_probes(token: str, db_id: str, timeout: float = 30.0) -> Dict[str, Any]:
+    """Independent checks run concurrently by diagnostics.run_probes, each bounded by `timeout`."""
+    def query() -> Dict[str, Any]:
+        ok, info = sanity_query(token, db_id, budget=timeout)
+        return {"ok": ok, "error": None if ok else info}
+
+    def latency(url: str):
+        def probe() -> Dict[str, Any]:
+            timing = measure_endpoint(url, timeout=min(10.0, timeout))
+            return {"ok": "error" not in timing, "timing": timing}
+        return probe
+
+    probes = {
+        "notion_query": query,
+        "api.notion.com": latency("https://api.notion.com/v1/users/me"),
+    }
+    if os.getenv("GH_TOKEN") or os.getenv("GITHUB_TOKEN"):
+        probes["api.github.com"] = latency("https://api.github.com/")
+    return probes
 
 
 def run_scheduler_validation(cfg_path: str, dry_run: bool, max_n: int) -> int:
@@ -152,14 +173,20 @@ def main(argv=None):
     args = parse_args(argv)
     token, db_id = assert_token_and_db()
     print(f"[INFO] Token present, DB={db_id}")
-    ok, info = sanity_query(token, db_id)
+    results = run_probes(connectivity_probes(token, db_id, args.probe_timeout), timeout=args.probe_timeout)
+    for name, res in results.items():
+        timing = res.get("timing") or {}
+        phases = " ".join(f"{k[:-3]}={v:.0f}ms" for k, v in timing.items() if k.endswith("_ms"))
+        print(f"[INFO] probe {name}: ok={res.get('ok')} elapsed={res.get('elapsed_ms', 0):.0f}ms {phases}".rstrip())
     sections: List[Tuple[str, str]] = []
+    ok = results["notion_query"].get("ok")
+    info = results["notion_query"].get("error")
     if ok:
         print("[INFO] Notion database reachable.")
-        sections.append(("Connectivity", "<p class='ok'>Reachable</p>"))
+        sections.append(("Connectivity", "<p class='ok'>Reachable</p>" + render_timing_table(results)))
     else:
         print(f"[ERROR] Notion query failed: {info}")
-        sections.append(("Connectivity", f"<p class='err'>Failed: {info}</p>"))
+        sections.append(("Connectivity", f"<p class='err'>Failed: {info}</p>" + render_timing_table(results)))
         if args.report:
             write_html_report(Path(args.report), sections)
         raise SystemExit(1)
@@ -169,7 +196,8 @@ def main(argv=None):
         print("[INFO] Ensuring required database properties exist...")
         mapping = ensure_db_properties(token, db_id)
         print("[INFO] Properties ensured.")
-        sections.append(("DB Properties", "<p class='ok'>Ensured/Verified</p>"))
+        resolved = ", ".join(f"{k}={v}" for k, v in mapping.items())
+        sections.append(("DB Properties", f"<p class='ok'>Ensured/Verified</p><p>{resolved}</p>"))
 
     if args.init and args.seed:
         print(f"[INFO] Initializing seed cards from: {args.seed}")
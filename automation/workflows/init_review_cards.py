@@ -21,13 +21,19 @@ Creates pages in the review database with initial properties:
 Optionally add tags via --tags "三维,点云" (auto create multi_select values).
 
 Use --limit to restrict creations, --dry-run to preview payloads.
+
+Seeding is idempotent: titles already present in the review database (one
+paginated query) or recorded in the checkpoint file are skipped, and the rest
+are created through a bounded, rate-limited worker pool (config `concurrency`,
+`rate_limit_per_sec`). Every created title is appended to the checkpoint
+(default: <seed file>.checkpoint.jsonl) so an interrupted run resumes cleanly.
 """
 from __future__ import annotations
 import os, sys, json, csv
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Set
 import argparse
-import requests
 
 # Ensure root on path
 _ROOT = Path(__file__).resolve().parent.parent
@@ -44,7 +50,11 @@ if not ((os.getenv("NOTION_TOKEN") or os.getenv("NOTION_API_KEY")) and os.getenv
         except Exception:
             pass
 
+from automation.utils.notion_api import NOTION_API, RateLimiter, ordered_map, request_with_retry
+from automation.utils.schema_cache import REVIEW_PROPERTIES, get_schema_cache, resolve_property_names
+
 NOTION_VERSION = "2022-06-28"
+CHECKPOINT_FSYNC_EVERY = 20
 
 
 def parse_args(argv=None):
@@ -54,6 +64,7 @@ def parse_args(argv=None):
     p.add_argument("--tags", help="Comma separated tags to apply to all cards")
     p.add_argument("--limit", type=int, help="Max number of cards to create")
     p.add_argument("--dry-run", action="store_true", help="Show payloads only")
+    p.add_argument("--checkpoint", help="Checkpoint file of created titles (default: <file>.checkpoint.jsonl)")
     return p.parse_args(argv)
 
 
@@ -69,11 +80,9 @@ def headers(token: str) -> Dict[str, str]:
     }
 
 
-def fetch_db_schema(token: str, db_id: str) -> Dict[str, Any]:
-    r = requests.get(f"https://api.notion.com/v1/databases/{db_id}", headers=headers(token), timeout=40)
-    if r.status_code != 200:
-        raise RuntimeError(f"fetch database schema failed status={r.status_code} body={r.text[:200]}")
-    return r.json()
+def fetch_db_schema(token: str, db_id: str, refresh: bool = False) -> Dict[str, Any]:
+    """Database schema from the shared on-disk cache (GET only when stale)."""
+    return get_schema_cache().get(token, db_id, refresh=refresh)
 
 
 def find_title_property_name(db_json: Dict[str, Any]) -> str:
@@ -87,17 +96,8 @@ def find_title_property_name(db_json: Dict[str, Any]) -> str:
 def ensure_db_properties(token: str, db_id: str) -> Dict[str, str]:
     db = fetch_db_schema(token, db_id)
     props = db.get("properties", {})
-    title_name = find_title_property_name(db)
-    mapping = {
-        "title": title_name,
-        "stage": "阶段 Stage",
-        "ease": "Ease",
-        "interval": "Interval",
-        "status": "状态",
-        "last_date": "上次复习日期",
-        "next_date": "下次复习日期",
-        "tags": "标签",
-    }
+    mapping = resolve_property_names(db, REVIEW_PROPERTIES)
+    mapping["title"] = find_title_property_name(db)
     to_add: Dict[str, Any] = {}
     def missing(name: str) -> bool:
         return name not in props
@@ -120,10 +120,7 @@ def ensure_db_properties(token: str, db_id: str) -> Dict[str, str]:
         to_add[mapping["tags"]] = {"multi_select": {"options": []}}
 
     if to_add:
-        payload = {"properties": to_add}
-        r = requests.patch(f"https://api.notion.com/v1/databases/{db_id}", headers=headers(token), json=payload, timeout=60)
-        if r.status_code != 200:
-            raise RuntimeError(f"update database props failed status={r.status_code} body={r.text[:240]}")
+        get_schema_cache().patch_properties(token, db_id, to_add)
     return mapping
 
 
@@ -181,15 +178,82 @@ def build_properties(title: str, ease: float, tags: List[str], mapping: Dict[str
     return props
 
 
-def create_page(token: str, db_id: str, properties: Dict[str, Any], dry_run: bool) -> bool:
+def fetch_existing_titles(token: str, db_id: str, title_name: str, limiter: Optional[RateLimiter] = None) -> Set[str]:
+    """All card titles already in the database, loaded with one paginated query."""
+    titles: Set[str] = set()
+    body: Dict[str, Any] = {"page_size": 100}
+    while True:
+        r = request_with_retry("POST", f"{NOTION_API}/databases/{db_id}/query", token, body, limiter=limiter, timeout=40)
+        if r is None or r.status_code != 200:
+            status = r.status_code if r is not None else "no response"
+            raise RuntimeError(f"query existing cards failed status={status}")
+        data = r.json()
+        for page in data.get("results", []):
+            rich = page.get("properties", {}).get(title_name, {}).get("title", [])
+            t = "".join(x.get("plain_text", "") for x in rich).strip()
+            if t:
+                titles.add(t)
+        if not data.get("has_more"):
+            return titles
+        body["start_cursor"] = data.get("next_cursor")
+
+
+class Checkpoint:
+    """Append-only JSONL record of created titles, fsync'd every CHECKPOINT_FSYNC_EVERY entries."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.done: Set[str] = set()
+        self._fh = None
+        self._pending = 0
+        if path.exists():
+            raw = path.read_bytes()
+            complete = raw[: raw.rfind(b"\n") + 1]
+            if len(complete) != len(raw):
+                # drop the torn last line from a crash, so the next append starts on a fresh line
+                with path.open("r+b") as f:
+                    f.truncate(len(complete))
+            for line in complete.decode("utf-8", errors="replace").splitlines():
+                try:
+                    self.done.add(json.loads(line)["title"])
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+    def add(self, title: str):
+        if self._fh is None:
+            self._fh = self.path.open("a", encoding="utf-8")
+        self._fh.write(json.dumps({"title": title}, ensure_ascii=False) + "\n")
+        self.done.add(title)
+        self._pending += 1
+        if self._pending >= CHECKPOINT_FSYNC_EVERY:
+            self.flush()
+
+    def flush(self):
+        if self._fh is not None and self._pending:
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            self._pending = 0
+
+    def close(self):
+        self.flush()
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+def create_page(token: str, db_id: str, properties: Dict[str, Any], dry_run: bool,
+                limiter: Optional[RateLimiter] = None) -> bool:
     payload = {"parent": {"database_id": db_id}, "properties": properties}
     if dry_run:
         print(json.dumps({"CREATE_PREVIEW": payload}, ensure_ascii=False))
         return True
-    r = requests.post("https://api.notion.com/v1/pages", headers=headers(token), json=payload, timeout=40)
-    if r.status_code == 200:
+    r = request_with_retry("POST", f"{NOTION_API}/pages", token, payload, limiter=limiter, timeout=40)
+    if r is not None and r.status_code == 200:
         return True
-    print(f"[WARN] create failed status={r.status_code} body={r.text[:200]}")
+    if r is not None:
+        print(f"[WARN] create failed status={r.status_code} body={r.text[:200]}")
+    else:
+        print("[WARN] create failed: no response (network/retry exceeded)")
     return False
 
 
@@ -212,19 +276,34 @@ def main(argv=None):
     if not titles:
         print("[INFO] no titles found in seed file")
         return 0
-    if args.limit:
-        titles = titles[: args.limit]
     tags = [t.strip() for t in args.tags.split(",") if t.strip()] if args.tags else []
     ease_default = float(cfg.get("default_ease", 2.5))
+    concurrency = max(1, int(cfg.get("concurrency", 3)))
+    limiter = RateLimiter(cfg.get("rate_limit_per_sec", 3))
     # Ensure DB properties exist, get actual names
     mapping = ensure_db_properties(token, review_db)
+    existing = fetch_existing_titles(token, review_db, mapping["title"], limiter)
+    checkpoint = Checkpoint(Path(args.checkpoint or args.file + ".checkpoint.jsonl"))
+    pending = [t for t in titles if t not in existing and t not in checkpoint.done]
+    print(f"[INFO] seed={len(titles)} existing={len(titles) - len(pending)} to_create={len(pending)}")
+    if args.limit:
+        pending = pending[: args.limit]
+
+    def create(title: str) -> bool:
+        props = build_properties(title, ease_default, tags, mapping)
+        return create_page(token, review_db, props, args.dry_run, limiter)
+
     created = 0
-    for t in titles:
-        props = build_properties(t, ease_default, tags, mapping)
-        ok = create_page(token, review_db, props, args.dry_run)
-        if ok:
-            created += 1
-    print(f"[DONE] attempted={len(titles)} created={created} dry_run={args.dry_run}")
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for title, ok in ordered_map(create, pending, pool, concurrency * 2):
+                if ok:
+                    created += 1
+                    if not args.dry_run:
+                        checkpoint.add(title)
+    finally:
+        checkpoint.close()
+    print(f"[DONE] attempted={len(pending)} created={created} dry_run={args.dry_run}")
     return 0
 
 
@@ -13,14 +13,25 @@
 """
 
 import os
+import re
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 from dotenv import load_dotenv
 import requests
+from requests.adapters import HTTPAdapter
 from enum import Enum
 
+# 项目根目录加入 sys.path（本脚本也会被 workflow.py 以顶层模块方式导入）
+import sys
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
+
+from automation.utils.notion_api import NOTION_API, RateLimiter, request_with_retry
+
 # ==================== 配置 ====================
 
 # 加载环境变量
@@ -44,6 +55,18 @@ if not NOTION_DATABASE_ID:
 GITHUB_REPO = os.getenv('GITHUB_REPO')  # format: owner/repo
 APPLE_CALENDAR_URL = os.getenv('APPLE_CALENDAR_URL')  # CalDAV URL
 
+# GitHub Issue 本地缓存（ETag + since 增量拉取）
+GITHUB_CACHE_PATH = os.getenv(
+    'GITHUB_CACHE_PATH', os.path.join(os.path.dirname(__file__), 'github_issue_cache.json')
+)
+# GitHub→Notion 同步状态（closed_at 水位线 + 已完成页面）
+SYNC_STATE_PATH = os.getenv(
+    'GITHUB_SYNC_STATE_PATH', os.path.join(os.path.dirname(__file__), 'github_notion_sync_state.json')
+)
+# 并发更新 Notion 页面的线程数（Notion 平均限速约 3 次/秒）
+NOTION_SYNC_CONCURRENCY = int(os.getenv('NOTION_SYNC_CONCURRENCY', '3'))
+NOTION_RATE_LIMIT_PER_SEC = float(os.getenv('NOTION_RATE_LIMIT_PER_SEC', '3'))
+
 # DRY_RUN: 若为 True 则不会执行外部写操作（默认 True，便于本地测试）
 DRY_RUN = os.getenv('DRY_RUN', 'True').lower() not in ('false', '0', 'no')
 
@@ -69,7 +92,6 @@ EMAIL_USER = os.getenv('EMAIL_USER')
 EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD')
 
 # 日志配置（修复 Windows 控制台编码问题）
-import sys
 if sys.platform == 'win32':
     # Windows 环境强制使用 UTF-8
     import codecs
@@ -192,10 +214,88 @@ class NotionClient:
 
 # ==================== GitHub API 操作 ====================
 
+class IssueCache:
+    """GitHub Issue 磁盘缓存
+
+    保存全部 Issue（state=all）的精简字段，以及上次列表请求的 `since` 与 ETag。
+    `since` 取缓存中最大的 updated_at：没有新变更时请求 URL 不变，
+    携带 If-None-Match 即得到 304（不计入 GitHub 速率限制）。
+    """
+
+    FIELDS = ('number', 'title', 'state', 'body', 'closed_at', 'updated_at')
+
+    def __init__(self, path: str = GITHUB_CACHE_PATH, repo: Optional[str] = None):
+        self.path = path
+        self.repo = repo
+        self.etag: Optional[str] = None
+        self.since: Optional[str] = None
+        self.issues: Dict[str, Dict] = {}
+        # 是否读到了本仓库此前成功拉取的缓存
+        self.loaded = False
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取 Issue 缓存失败，将全量拉取: {e}")
+            return
+        if data.get('repo') != self.repo:
+            return
+        self.etag = data.get('etag')
+        self.since = data.get('since')
+        self.issues = data.get('issues', {})
+        self.loaded = True
+
+    def save(self):
+        data = {'repo': self.repo, 'etag': self.etag, 'since': self.since, 'issues': self.issues}
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"保存 Issue 缓存失败: {e}")
+
+    @staticmethod
+    def _compact(issue: Dict) -> Dict:
+        item = {k: issue.get(k) for k in IssueCache.FIELDS}
+        item['labels'] = [{'name': l.get('name')} for l in issue.get('labels', []) if isinstance(l, dict)]
+        if 'pull_request' in issue:
+            item['pull_request'] = True
+        return item
+
+    def merge(self, issues: List[Dict]):
+        """合并增量结果，并把 since 推进到最大的 updated_at"""
+        for issue in issues:
+            self.issues[str(issue['number'])] = self._compact(issue)
+            updated = issue.get('updated_at')
+            if updated and (self.since is None or updated > self.since):
+                self.since = updated
+
+    def select(self, labels: Optional[List[str]] = None, state: str = 'open') -> List[Dict]:
+        """按 state / labels 在本地过滤（labels 需全部匹配，与 GitHub API 语义一致）"""
+        wanted = set(labels or [])
+        result = []
+        for issue in self.issues.values():
+            if state != 'all' and issue.get('state') != state:
+                continue
+            if wanted and not wanted <= {l.get('name') for l in issue.get('labels', [])}:
+                continue
+            result.append(issue)
+        return sorted(result, key=lambda i: i.get('number', 0), reverse=True)
+
+
 class GitHubClient:
     """GitHub操作客户端"""
     
     BASE_URL = "https://api.github.com"
+    _session: Optional[requests.Session] = None
+    # 最近一次 get_issues 的结果是否可信（刷新成功，或刷新失败但有旧缓存可用）
+    issues_available: bool = True
 
     @staticmethod
     def _headers():
@@ -204,6 +304,14 @@ class GitHubClient:
             "Authorization": f"Bearer {token}" if token else "",
             "Accept": "application/vnd.github.v3+json"
         }
+
+    @classmethod
+    def session(cls) -> requests.Session:
+        """复用连接池的 Session（keep-alive，避免每次请求重新握手）"""
+        if cls._session is None:
+            cls._session = requests.Session()
+            cls._session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+        return cls._session
     
     @staticmethod
     def create_issue(title: str, body: str, labels: List[str] = None, 
@@ -224,7 +332,7 @@ class GitHubClient:
             if DRY_RUN:
                 logger.info(f"DRY_RUN: 模拟创建 GitHub Issue: {title}，labels={labels}")
                 return 'dry-run-issue'
-            response = requests.post(url, headers=GitHubClient._headers(), json=payload)
+            response = GitHubClient.session().post(url, headers=GitHubClient._headers(), json=payload)
             response.raise_for_status()
             issue_number = response.json().get('number')
             logger.info(f"创建GitHub Issue成功: #{issue_number}")
@@ -244,7 +352,7 @@ class GitHubClient:
             if DRY_RUN:
                 logger.info(f"DRY_RUN: 模拟关闭 GitHub Issue #{issue_number}")
                 return True
-            response = requests.patch(url, headers=GitHubClient._headers(), json=payload)
+            response = GitHubClient.session().patch(url, headers=GitHubClient._headers(), json=payload)
             response.raise_for_status()
             logger.info(f"关闭GitHub Issue成功: #{issue_number}")
             return True
@@ -254,29 +362,148 @@ class GitHubClient:
     
     @staticmethod
     def get_issues(labels: List[str] = None, state: str = "open") -> List[Dict]:
-        """查询GitHub Issues"""
+        """查询GitHub Issues
+
+        先用 `since` + If-None-Match 增量刷新本地缓存（无变更时为 304），再在本地按 state/labels 过滤。
+        """
+        if DRY_RUN:
+            logger.info(f"DRY_RUN: 模拟查询 GitHub Issues，labels={labels}, state={state}")
+            return []
+        cache = IssueCache(repo=GITHUB_REPO)
+        try:
+            GitHubClient._refresh_cache(cache)
+            GitHubClient.issues_available = True
+        except requests.RequestException as e:
+            # 刷新失败（限流/网络/翻页中断）时退回已有缓存，避免调用方误以为没有任何 Issue
+            GitHubClient.issues_available = cache.loaded
+            logger.error(f"查询GitHub Issues失败，使用本地缓存 {len(cache.issues)} 条: {e}")
+        return cache.select(labels, state)
+
+    @staticmethod
+    def _refresh_cache(cache: IssueCache):
+        """拉取 cache.since 之后更新过的 Issue（自动翻页，每页100条）并写回缓存"""
         owner, repo = GITHUB_REPO.split('/')
         url = f"{GitHubClient.BASE_URL}/repos/{owner}/{repo}/issues"
-        params = {"state": state}
-        if labels:
-            params["labels"] = ",".join(labels)
-        
-        try:
-            if DRY_RUN:
-                logger.info(f"DRY_RUN: 模拟查询 GitHub Issues，labels={labels}, state={state}")
-                return []
-            response = requests.get(url, headers=GitHubClient._headers(), params=params)
+        params = {"state": "all", "per_page": 100, "sort": "updated", "direction": "asc"}
+        if cache.since:
+            params["since"] = cache.since
+        headers = GitHubClient._headers()
+        if cache.etag:
+            headers["If-None-Match"] = cache.etag
+        http = GitHubClient.session()
+
+        response = http.get(url, headers=headers, params=params)
+        if response.status_code == 304:
+            logger.info(f"GitHub Issues 无变更（304，缓存 {len(cache.issues)} 条）")
+            return
+        response.raise_for_status()
+        etag = response.headers.get('ETag')
+        changed: List[Dict] = []
+        while True:
+            changed.extend(response.json())
+            # 下一页地址已包含查询参数
+            next_url = response.links.get('next', {}).get('url')
+            if not next_url:
+                break
+            response = http.get(next_url, headers=GitHubClient._headers())
             response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            logger.error(f"查询GitHub Issues失败: {e}")
-            return []
+        cache.merge(changed)
+        # since 推进后请求 URL 改变，旧 ETag 只在 since 未变时有效
+        cache.etag = etag if cache.since == params.get("since") else None
+        cache.save()
+        logger.info(f"GitHub Issues 增量更新: {len(changed)} 条（缓存 {len(cache.issues)} 条）")
+
+# ==================== Issue 索引 ====================
+
+NOTION_PAGE_ID_PATTERN = re.compile(r'Notion页面ID:\s*([0-9a-fA-F]{8}-?(?:[0-9a-fA-F]{4}-?){3}[0-9a-fA-F]{12})')
+
+def normalize_page_id(page_id: str) -> str:
+    """统一 Notion 页面ID格式（去掉连字符并小写），带/不带连字符的ID视为同一页面"""
+    return (page_id or '').replace('-', '').lower()
+
+def extract_notion_page_id(body: Optional[str]) -> Optional[str]:
+    """从Issue描述中解析 `Notion页面ID:` 标记，返回规范化后的页面ID"""
+    match = NOTION_PAGE_ID_PATTERN.search(body or '')
+    return normalize_page_id(match.group(1)) if match else None
+
+def build_issue_index(issues: List[Dict]) -> Dict[str, Dict]:
+    """页面ID → Issue 索引；跳过 Pull Request 和没有标记的 Issue，同一页面保留编号最大的 Issue"""
+    index: Dict[str, Dict] = {}
+    for issue in issues:
+        if issue.get('pull_request'):
+            continue
+        page_id = extract_notion_page_id(issue.get('body'))
+        if not page_id:
+            continue
+        current = index.get(page_id)
+        if current is None or issue.get('number', 0) > current.get('number', 0):
+            index[page_id] = issue
+    return index
+
+class SyncState:
+    """GitHub→Notion 同步状态
+
+    `watermark` 为已全部处理完的最大 closed_at；`completed` 记录已标记完成的页面及其 Issue 的 closed_at，
+    Issue 重新打开后再次关闭（closed_at 变化）时会再同步一次。
+    """
+
+    def __init__(self, path: str = SYNC_STATE_PATH):
+        self.path = path
+        self.watermark: Optional[str] = None
+        self.completed: Dict[str, str] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.watermark = data.get('watermark')
+                self.completed = data.get('completed', {})
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取同步状态失败，将重新同步全部已关闭 Issue: {e}")
+
+    def save(self):
+        # 早于水位线的 Issue 不会再被 pending 取出，其完成记录无需保留
+        if self.watermark:
+            self.completed = {k: v for k, v in self.completed.items() if v >= self.watermark}
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'watermark': self.watermark, 'completed': self.completed}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"保存同步状态失败: {e}")
+
+    def pending(self, index: Dict[str, Dict]) -> List[tuple]:
+        """水位线之后关闭、且尚未标记完成的 (页面ID, Issue)，按 closed_at 升序"""
+        items = []
+        for page_id, issue in index.items():
+            closed_at = issue.get('closed_at')
+            if issue.get('state') != 'closed' or not closed_at:
+                continue
+            # 与水位线相等的也取出：同一秒关闭的 Issue 可能上次未处理完，由 completed 去重
+            if self.watermark and closed_at < self.watermark:
+                continue
+            if self.completed.get(page_id) == closed_at:
+                continue
+            items.append((page_id, issue))
+        return sorted(items, key=lambda item: item[1]['closed_at'])
 
 # ==================== 同步核心逻辑 ====================
 
 class SyncEngine:
     """Notion-GitHub同步引擎"""
     
+    # 页面ID → Issue 索引，一次运行内由两个方向的同步共享
+    _issue_index: Optional[Dict[str, Dict]] = None
+    
+    @classmethod
+    def issue_index(cls, refresh: bool = False) -> Dict[str, Dict]:
+        """一次性分页拉取全部 Issue（open + closed）并建立索引，后续调用直接复用"""
+        if cls._issue_index is None or refresh:
+            issues = GitHubClient.get_issues(state="all")
+            cls._issue_index = build_issue_index(issues)
+            logger.info(f"Issue索引已建立: issues={len(issues)} 关联页面={len(cls._issue_index)}")
+        return cls._issue_index
+    
     @staticmethod
     def sync_notion_to_github():
         """从Notion同步任务到GitHub"""
@@ -291,8 +518,19 @@ class SyncEngine:
         }
         
         tasks = NotionClient.query_database(NOTION_DATABASE_ID, filter_params)
+        index = SyncEngine.issue_index() if tasks else {}
+        if tasks and not GitHubClient.issues_available:
+            # 既没拉到 Issue 列表也没有缓存，无法判断哪些任务已有 Issue，跳过以免重复创建
+            SyncEngine._issue_index = None
+            logger.error("无法获取 GitHub Issue 列表，跳过 Notion→GitHub 同步")
+            return
         
         for task in tasks:
+            page_id = task['id']
+            # 检查是否已经有对应的Issue（通过Notion页面ID）
+            if normalize_page_id(page_id) in index:
+                continue
+            
             properties = task.get('properties', {})
             
             # 提取关键信息
@@ -314,48 +552,77 @@ class SyncEngine:
 
 ---
 _此Issue从Notion自动生成_  
-_Notion页面ID: {task['id']}_
+_Notion页面ID: {page_id}_
 """
             
             # 映射优先级到标签
             labels = [f"priority:{priority.split()[-1].lower()}", f"type:{task_type}"]
             
-            # 检查是否已经有对应的Issue（通过Notion页面ID）
-            existing_issues = GitHubClient.get_issues()
-            page_id = task['id']
-            
-            issue_exists = any(page_id in issue.get('body', '') for issue in existing_issues)
-            
-            if not issue_exists:
-                GitHubClient.create_issue(
-                    title=f"[{task_type}] {title}",
-                    body=body,
-                    labels=labels,
-                    due_date=due_date.get('start') if due_date else None
-                )
+            issue_number = GitHubClient.create_issue(
+                title=f"[{task_type}] {title}",
+                body=body,
+                labels=labels,
+                due_date=due_date.get('start') if due_date else None
+            )
+            if issue_number:
+                # 记入索引，避免同一次运行中重复创建
+                index[normalize_page_id(page_id)] = {"number": issue_number, "state": "open", "body": body}
         
         logger.info("Notion→GitHub同步完成")
     
     @staticmethod
     def sync_github_to_notion():
-        """从GitHub同步完成状态到Notion"""
+        """从GitHub同步完成状态到Notion（只处理上次水位线之后新关闭的 Issue）"""
         logger.info("开始GitHub→Notion同步...")
         
-        closed_issues = GitHubClient.get_issues(state="closed")
+        state = SyncState()
+        pending = state.pending(SyncEngine.issue_index())
+        if not pending:
+            logger.info("没有新关闭的 Issue")
+            logger.info("GitHub→Notion同步完成")
+            return
         
-        for issue in closed_issues:
-            # 从Issue描述中提取Notion页面ID
-            body = issue.get('body', '')
-            if 'Notion页面ID:' in body:
-                page_id = body.split('Notion页面ID:')[-1].strip().split('\n')[0]
-                
-                # 更新Notion页面状态为"已完成"
-                NotionClient.update_page(page_id, {
-                    "Status": {"select": {"name": "已完成"}},
-                    "Completion Time": {"date": {"start": datetime.now().isoformat()}}
-                })
+        # 并发线程共享限速器；429 按 Retry-After 重试，不会直接算作失败
+        limiter = RateLimiter(NOTION_RATE_LIMIT_PER_SEC)
+        token = get_notion_api_key() or ''
+        
+        def mark_done(item) -> bool:
+            page_id, issue = item
+            # 更新Notion页面状态为"已完成"，完成时间取 Issue 的关闭时间
+            properties = {
+                "Status": {"select": {"name": "已完成"}},
+                "Completion Time": {"date": {"start": issue['closed_at']}}
+            }
+            if DRY_RUN:
+                logger.info(f"DRY_RUN: 将跳过更新 Notion 页面 {page_id}，属性: {properties}")
+                return True
+            response = request_with_retry("PATCH", f"{NOTION_API}/pages/{page_id}", token,
+                                          {"properties": properties}, limiter=limiter, timeout=30)
+            if response is not None and response.status_code == 200:
+                logger.info(f"更新Notion页面成功: {page_id}")
+                return True
+            status = response.status_code if response is not None else "no response"
+            logger.error(f"更新Notion页面失败: {page_id} status={status}")
+            return False
+        
+        with ThreadPoolExecutor(max_workers=max(1, NOTION_SYNC_CONCURRENCY)) as pool:
+            results = list(pool.map(mark_done, pending))
+        
+        failed_at = None
+        for (page_id, issue), ok in zip(pending, results):
+            if ok:
+                state.completed[page_id] = issue['closed_at']
+            elif failed_at is None:
+                failed_at = issue['closed_at']
+        # 水位线只推进到第一个失败项之前，失败的页面下次重试
+        done = [issue['closed_at'] for (_, issue), ok in zip(pending, results)
+                if ok and (failed_at is None or issue['closed_at'] < failed_at)]
+        if done:
+            state.watermark = max(done + ([state.watermark] if state.watermark else []))
+        if not DRY_RUN:
+            state.save()
         
-        logger.info("GitHub→Notion同步完成")
+        logger.info(f"GitHub→Notion同步完成: 更新 {results.count(True)} 个页面，失败 {results.count(False)} 个")
 
 # ==================== 提醒与通知 ====================
 
@@ -20,6 +20,11 @@ Optional flags:
 --tasks-sync create a task when status becomes 完成
 --backup save pre-update snapshot for rollback
 --generate-dashboard produce markdown dashboard
+--daily-cap N cap reviews scheduled per future day (config max_reviews_per_day)
+--no-balance keep raw SM-2 next dates
+
+Cards are processed most-overdue first (then lowest Ease / stage); new next dates
+are spread over a fuzz window to the least loaded day (see utils/due_queue.py).
 """
 from __future__ import annotations
 import argparse
@@ -51,13 +56,23 @@ if str(_ROOT) not in sys.path:
 
 try:
     from automation.utils.spaced_repetition import schedule_review, is_due
+    from automation.utils.due_queue import DueQueue, WorkloadIndex
 except ModuleNotFoundError:
     # Fallback: attempt relative import if executed as package module
     try:
         from ..utils.spaced_repetition import schedule_review, is_due  # type: ignore
+        from ..utils.due_queue import DueQueue, WorkloadIndex  # type: ignore
     except Exception as e:  # pragma: no cover
         raise
 
+from automation.utils.schema_cache import (
+    REVIEW_PROPERTIES,
+    TASKS_PROPERTIES,
+    default_property_names,
+    get_schema_cache,
+    resolve_property_names,
+)
+
 NOTION_VERSION = "2022-06-28"
 RATE_LIMIT_PER_SEC = 3
 
@@ -113,6 +128,8 @@ def parse_args(argv=None):
     p.add_argument("--tasks-sync", action="store_true", help="Create related task when completed")
     p.add_argument("--backup", action="store_true", help="Save backup JSON before updates")
     p.add_argument("--generate-dashboard", action="store_true", help="Generate markdown dashboard")
+    p.add_argument("--daily-cap", type=int, help="Max reviews scheduled per future day (config max_reviews_per_day)")
+    p.add_argument("--no-balance", action="store_true", help="Keep raw SM-2 next dates (no load balancing)")
     return p.parse_args(argv)
 
 
@@ -128,15 +145,16 @@ def load_config(path: str) -> Dict[str, Any]:
     return json.loads(Path(path).read_text(encoding="utf-8"))
 
 
-def fetch_cards(token: str, db_id: str, only_due: bool, today_iso: str) -> List[Dict[str, Any]]:
+def fetch_cards(token: str, db_id: str, only_due: bool, today_iso: str, names: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
     url = f"https://api.notion.com/v1/databases/{db_id}/query"
     payload: Dict[str, Any] = {"page_size": 100}
     if only_due:
         # Filter 下次复习日期 <= today OR empty
+        next_prop = (names or {}).get("next_date", "下次复习日期")
         payload["filter"] = {
             "or": [
-                {"property": "下次复习日期", "date": {"is_empty": True}},
-                {"property": "下次复习日期", "date": {"on_or_before": today_iso}},
+                {"property": next_prop, "date": {"is_empty": True}},
+                {"property": next_prop, "date": {"on_or_before": today_iso}},
             ]
         }
     results: List[Dict[str, Any]] = []
@@ -158,10 +176,51 @@ def fetch_cards(token: str, db_id: str, only_due: bool, today_iso: str) -> List[
     return results
 
 
+def fetch_future_load(token: str, db_id: str, today_iso: str, names: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+    """Canonical properties of every card already scheduled after today (seeds load balancing)."""
+    url = f"https://api.notion.com/v1/databases/{db_id}/query"
+    next_prop = (names or {}).get("next_date", "下次复习日期")
+    payload: Dict[str, Any] = {"page_size": 100, "filter": {"property": next_prop, "date": {"after": today_iso}}}
+    loads: List[Dict[str, Any]] = []
+    while True:
+        r = _request_with_retry("POST", url, token, payload, timeout=30)
+        if r is None or r.status_code != 200:
+            status = r.status_code if r is not None else "no response"
+            print(f"[WARN] future load query failed status={status}; balancing uses partial load")
+            break
+        data = r.json()
+        loads.extend(canonical_properties(extract_properties(p), names or {}) for p in data.get("results", []))
+        next_cursor = data.get("next_cursor")
+        if not next_cursor:
+            break
+        payload["start_cursor"] = next_cursor
+    return loads
+
+
 def extract_properties(page: Dict[str, Any]) -> Dict[str, Any]:
     return page.get("properties", {})
 
 
+def review_property_names(token: str, review_db: str) -> Dict[str, str]:
+    """Actual review DB property names from the shared schema cache (defaults if unavailable)."""
+    try:
+        return resolve_property_names(get_schema_cache().get(token, review_db), REVIEW_PROPERTIES)
+    except RuntimeError as e:
+        print(f"[WARN] review schema unavailable, using default property names: {e}")
+        return default_property_names(REVIEW_PROPERTIES)
+
+
+def canonical_properties(props: Dict[str, Any], names: Dict[str, str]) -> Dict[str, Any]:
+    """Re-key renamed review properties under the default names the helpers expect."""
+    defaults = default_property_names(REVIEW_PROPERTIES)
+    out = dict(props)
+    for field, actual in names.items():
+        default = defaults[field]
+        if actual != default and actual in props:
+            out[default] = props[actual]
+    return out
+
+
 def title_text(props: Dict[str, Any]) -> str:
     # Prefer dynamic detection of title-type property
     try:
@@ -282,7 +341,7 @@ def generate_dashboard(md_path: Path, stats: Dict[str, Any]):
     filled = min(bar_len, max(0, int(bar_len * ratio)))
     ease_bar = '█' * filled + '░' * (bar_len - filled)
     lines.extend([
-        '', '## Ease 变化', f'平均Ease前: {avg_before:.2f}', f'平均Ease后: {avg_after:.2f}', f'变化差值: {diff:+.2f}', f'Ease 比例条: {ease_bar}', '', '## 到期与未到期', f'到期卡片数: {stats.get('due_count',0)}', f'未到期跳过: {stats.get('skipped_not_due',0)}',
+        '', '## Ease 变化', f'平均Ease前: {avg_before:.2f}', f'平均Ease后: {avg_after:.2f}', f'变化差值: {diff:+.2f}', f'Ease 比例条: {ease_bar}', '', '## 到期与未到期', f'到期卡片数: {stats.get("due_count",0)}', f'未到期跳过: {stats.get("skipped_not_due",0)}',
     ])
     md_path.write_text("\n".join(lines), encoding="utf-8")
 
@@ -423,37 +482,24 @@ def patch_card(token: str, page_id: str, updates: Dict[str, Any], dry_run: bool)
 
 
 def introspect_tasks_schema(token: str, tasks_db: str) -> Dict[str, str]:
-    mapping = {"title": "名称", "status": "状态", "relation": "关联复习卡"}
     if not tasks_db:
-        return mapping
-    r = _request_with_retry("GET", f"https://api.notion.com/v1/databases/{tasks_db}", token, {}, timeout=30)
-    if not r or r.status_code != 200:
-        return mapping
-    data = r.json()
-    props = data.get("properties", {})
-    for name, meta in props.items():
-        if meta.get("type") == "title":
-            mapping["title"] = name
-            break
-    for name, meta in props.items():
-        if meta.get("type") == "select" and name.lower() in ("状态", "status", "任务状态"):
-            mapping["status"] = name
-            break
-    for name, meta in props.items():
-        if meta.get("type") == "relation":
-            mapping["relation"] = name
-            break
-    return mapping
+        return default_property_names(TASKS_PROPERTIES)
+    try:
+        return resolve_property_names(get_schema_cache().get(token, tasks_db), TASKS_PROPERTIES)
+    except RuntimeError:
+        return default_property_names(TASKS_PROPERTIES)
 
 
-def build_updates(card_props: Dict[str, Any], schedule: Dict[str, Any], today_iso: str) -> Dict[str, Any]:
+def build_updates(card_props: Dict[str, Any], schedule: Dict[str, Any], today_iso: str,
+                  names: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    n = names or default_property_names(REVIEW_PROPERTIES)
     return {
-        "阶段 Stage": {"number": schedule["stage"]},
-        "Ease": {"number": schedule["ease"]},
-        "Interval": {"number": schedule["interval"]},
-        "上次复习日期": {"date": {"start": today_iso}},
-        "下次复习日期": {"date": {"start": schedule["next_date"]}},
-        "状态": {"select": {"name": schedule["status"]}},
+        n["stage"]: {"number": schedule["stage"]},
+        n["ease"]: {"number": schedule["ease"]},
+        n["interval"]: {"number": schedule["interval"]},
+        n["last_date"]: {"date": {"start": today_iso}},
+        n["next_date"]: {"date": {"start": schedule["next_date"]}},
+        n["status"]: {"select": {"name": schedule["status"]}},
     }
 
 
@@ -490,7 +536,8 @@ def main(argv=None):
         print(f"[ERROR] invalid --today date: {today_iso}")
         return 1
 
-    pages = fetch_cards(token, review_db, args.only_due, today_iso)
+    names = review_property_names(token, review_db)
+    pages = fetch_cards(token, review_db, args.only_due, today_iso, names)
     print(f"[INFO] fetched review pages total={len(pages)} only_due={args.only_due}")
     quality_map = load_quality_file(args.quality_file)
     required_tags = [t.strip() for t in args.tag.split(",")] if args.tag else []
@@ -502,9 +549,13 @@ def main(argv=None):
     ease_after_sum = 0.0
     stage_distribution: Dict[int, int] = {}
     backup_entries: List[Dict[str, Any]] = []
+    # Most at-risk cards first (overdue days, then low Ease, then low stage), so --max spends its budget there
+    queue: DueQueue = DueQueue(today_obj)
+    future_load: List[Dict[str, Any]] = []
     for page in pages:
-        props = extract_properties(page)
-        title = title_text(props)
+        raw_props = extract_properties(page)
+        props = canonical_properties(raw_props, names)
+        future_load.append(props)
         stage_val = stage_value(props)
         is_due_flag = is_due(props, today_obj)
         if is_due_flag:
@@ -518,8 +569,17 @@ def main(argv=None):
             continue
         if args.stage_max is not None and stage_val > args.stage_max:
             continue
+        queue.push((page, raw_props, props), props)
+    workload = WorkloadIndex.for_backlog(len(queue), args.daily_cap or config.get("max_reviews_per_day"))
+    if not args.no_balance:
+        if args.only_due:
+            # only due cards were fetched; count reviews already scheduled in the future separately
+            future_load = fetch_future_load(token, review_db, today_iso, names)
+        workload.seed(future_load, after=today_obj)
+    for page, raw_props, props in queue.take(args.max):
+        title = title_text(props)
         if args.backup:
-            backup_entries.append({"id": page.get("id"), "properties": props})
+            backup_entries.append({"id": page.get("id"), "properties": raw_props})
         q, lat = None, None
         if title in quality_map:
             q, lat = quality_map[title]
@@ -528,11 +588,13 @@ def main(argv=None):
         else:
             q = choose_quality(args.quality) if args.interactive else args.quality
         sched = schedule_review(props, quality=int(q), today=today_obj, latency=(lat if lat and lat >= 0 else None))
+        if not args.no_balance:
+            sched = workload.assign(sched, today_obj)
         ease_prop = props.get("Ease", {})
         if isinstance(ease_prop, dict) and isinstance(ease_prop.get("number"), (int, float)):
             ease_before_sum += float(ease_prop.get("number"))
         ease_after_sum += sched["ease"]
-        updates = build_updates(props, sched, today_iso)
+        updates = build_updates(props, sched, today_iso, names)
         ok = patch_card(token, page.get("id"), updates, args.dry_run)
         if ok:
             updated += 1
@@ -540,8 +602,6 @@ def main(argv=None):
         stage_distribution[sched["stage"]] = stage_distribution.get(sched["stage"], 0) + 1
         if args.tasks_sync and sched["status"] == "完成":
             ensure_tasks_entry(token, tasks_db, title, page.get("id"), args.dry_run, tasks_schema_map)
-        if args.max and processed >= args.max:
-            break
     stats = {
         "processed": processed,
         "updated": updated,
@@ -12,6 +12,9 @@ ENTER 显示卡片内容后开始计时，答出后再次 ENTER 停止计时。
 1-5 / 0 输入质量得分；(空回车=默认4)。
 Q 退出保存。
 
+--append 续写已有 CSV；--apply 每答一题即用 schedule_review 计算并由后台线程 PATCH 回 Notion。
+卡片按逾期天数、Ease、阶段排序（最易遗忘者优先）；后续卡片内容在作答时后台预取；每条答案立即写入 CSV（Ctrl-C 不丢数据）。
+
 CSV columns: title,quality,latency
 """
 from __future__ import annotations
@@ -19,13 +22,28 @@ import argparse
 import csv
 import json
 import os
+import queue
 import sys
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date
 from pathlib import Path
-from typing import Any, Dict, List
-import requests
+from typing import Any, Dict, List, Optional
+
+# Ensure project root on sys.path
+_ROOT = Path(__file__).resolve().parent.parent.parent
+if str(_ROOT) not in sys.path:
+    sys.path.insert(0, str(_ROOT))
+
+from automation.utils.due_queue import DueQueue, WorkloadIndex
+from automation.utils.notion_api import NOTION_API, RateLimiter, request_with_retry
+from automation.utils.spaced_repetition import schedule_review
+from automation.workflows import review_scheduler as rs
 
 NOTION_VERSION = "2022-06-28"
+PREFETCH_AHEAD = 3
+MAX_CONTENT_LINES = 30
 
 
 def parse_args(argv=None):
@@ -34,6 +52,8 @@ def parse_args(argv=None):
     p.add_argument("--out", required=True, help="Output CSV path")
     p.add_argument("--limit", type=int, help="Limit number of cards")
     p.add_argument("--today", help="Override today ISO date")
+    p.add_argument("--append", action="store_true", help="Append to an existing CSV instead of starting a new one")
+    p.add_argument("--apply", action="store_true", help="Schedule each answer and PATCH it in the background")
     return p.parse_args(argv)
 
 
@@ -49,22 +69,26 @@ def load_config(path: str) -> Dict[str, Any]:
     return json.loads(Path(path).read_text(encoding="utf-8"))
 
 
-def fetch_due(token: str, db_id: str, today_iso: str) -> List[Dict[str, Any]]:
-    url = f"https://api.notion.com/v1/databases/{db_id}/query"
+def fetch_due(token: str, db_id: str, today_iso: str, names: Optional[Dict[str, str]] = None,
+              cap: Optional[int] = None, limiter: Optional[RateLimiter] = None) -> List[Dict[str, Any]]:
+    """All due cards (or Notion's first `cap` of them); ordering is left to DueQueue."""
+    url = f"{NOTION_API}/databases/{db_id}/query"
+    next_prop = (names or {}).get("next_date", "下次复习日期")
     payload = {
         "filter": {
             "or": [
-                {"property": "下次复习日期", "date": {"is_empty": True}},
-                {"property": "下次复习日期", "date": {"on_or_before": today_iso}},
+                {"property": next_prop, "date": {"is_empty": True}},
+                {"property": next_prop, "date": {"on_or_before": today_iso}},
             ]
         },
-        "page_size": 50,
+        "page_size": min(100, cap) if cap else 100,
     }
     results: List[Dict[str, Any]] = []
     while True:
-        r = requests.post(url, headers=headers(token), json=payload, timeout=30)
-        if r.status_code != 200:
-            print(f"[ERROR] query failed status={r.status_code} body={r.text[:200]}")
+        r = request_with_retry("POST", url, token, payload, limiter=limiter, timeout=30)
+        if r is None or r.status_code != 200:
+            status = r.status_code if r is not None else "no response"
+            print(f"[ERROR] query failed status={status}")
             break
         data = r.json()
         batch = data.get("results", [])
@@ -73,18 +97,92 @@ def fetch_due(token: str, db_id: str, today_iso: str) -> List[Dict[str, Any]]:
         if not nxt:
             break
         payload["start_cursor"] = nxt
-        if len(results) >= 200:
+        if cap and len(results) >= cap:
             break
-    return results
+    return results[:cap] if cap else results
 
 
 def title_text(props: Dict[str, Any]) -> str:
-    t = props.get("卡片标题", {})
-    if isinstance(t, dict):
-        arr = t.get("title") or []
-        if arr:
-            return arr[0].get("text", {}).get("content", "")
-    return ""
+    return rs.title_text(props)
+
+
+def fetch_card_content(token: str, page_id: str, limiter: Optional[RateLimiter] = None) -> List[str]:
+    """Plain-text lines of a card's top-level blocks (first page of children)."""
+    r = request_with_retry("GET", f"{NOTION_API}/blocks/{page_id}/children?page_size=100", token, limiter=limiter, timeout=30)
+    if r is None or r.status_code != 200:
+        return []
+    lines: List[str] = []
+    for block in r.json().get("results", []):
+        btype = block.get("type", "")
+        rich = (block.get(btype) or {}).get("rich_text") or []
+        text = "".join(t.get("plain_text", "") for t in rich)
+        if not text:
+            continue
+        prefix = "- " if btype in ("bulleted_list_item", "numbered_list_item", "to_do") else ""
+        lines.append(prefix + text)
+    return lines[:MAX_CONTENT_LINES]
+
+
+class AnswerLog:
+    """CSV of answers; each row is flushed and fsync'd as soon as it is answered."""
+
+    FIELDS = ["title", "quality", "latency"]
+
+    def __init__(self, path: Path, append: bool):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fresh = not append or not path.exists() or path.stat().st_size == 0
+        self._fh = path.open("w" if not append else "a", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._fh, fieldnames=self.FIELDS)
+        if fresh:
+            self._writer.writeheader()
+        self.count = 0
+
+    def add(self, row: Dict[str, Any]):
+        self._writer.writerow(row)
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self.count += 1
+
+    def close(self):
+        self._fh.close()
+
+
+class PatchWriter(threading.Thread):
+    """Background thread draining queued card PATCHes so answering never waits on the network."""
+
+    def __init__(self, token: str, limiter: Optional[RateLimiter] = None):
+        super().__init__(daemon=True)
+        self.token = token
+        self.limiter = limiter
+        self.queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self.ok = 0
+        self.failed = 0
+
+    def submit(self, page_id: str, updates: Dict[str, Any]):
+        self.queue.put((page_id, updates))
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            page_id, updates = item
+            r = request_with_retry("PATCH", f"{NOTION_API}/pages/{page_id}", self.token, {"properties": updates},
+                                   limiter=self.limiter, timeout=30)
+            if r is not None and r.status_code == 200:
+                self.ok += 1
+            else:
+                self.failed += 1
+                status = r.status_code if r is not None else "no response"
+                print(f"\n[WARN] patch failed id={page_id} status={status}")
+
+    def close(self):
+        """Flush remaining PATCHes and stop."""
+        pending = self.queue.qsize()
+        if pending:
+            print(f"[INFO] waiting for {pending} pending updates...")
+        self.queue.put(None)
+        self.join()
 
 
 def main(argv=None):
@@ -99,43 +197,70 @@ def main(argv=None):
         print("[ERROR] review_db_id missing in config")
         return 1
     today_iso = args.today or time.strftime("%Y-%m-%d")
-    pages = fetch_due(token, review_db, today_iso)
-    cards = []
+    limiter = RateLimiter(cfg.get("rate_limit_per_sec", 3))
+    names = rs.review_property_names(token, review_db)
+    # fetch every due card so --limit keeps the most at-risk ones rather than Notion's first N
+    pages = fetch_due(token, review_db, today_iso, names, limiter=limiter)
+    today_obj = date.fromisoformat(today_iso)
+    due: DueQueue = DueQueue(today_obj)
     for p in pages:
-        props = p.get("properties", {})
-        cards.append({"id": p.get("id"), "title": title_text(props)})
-    if args.limit:
-        cards = cards[:args.limit]
+        props = rs.canonical_properties(p.get("properties", {}), names)
+        due.push({"id": p.get("id"), "title": title_text(props), "props": props}, props)
+    workload = WorkloadIndex.for_backlog(len(due), cfg.get("max_reviews_per_day"))
+    cards = due.take(args.limit)
     if not cards:
         print("[INFO] no due cards")
         return 0
     print(f"[INFO] due cards loaded: {len(cards)}")
-    rows: List[Dict[str, Any]] = []
-    for idx, c in enumerate(cards, 1):
-        print(f"\n==== [{idx}/{len(cards)}] {c['title']} ====")
-        input("按 ENTER 显示并开始计时...")
-        start = time.time()
-        input("回忆完毕后按 ENTER 停止计时...")
-        latency = time.time() - start
-        val = input("输入质量(0-5, 回车默认4, Q退出): ").strip().upper()
-        if val == 'Q':
-            print("[INFO] 用户中断，保存已收集数据")
-            break
-        if val == '':
-            quality = 4
-        elif val.isdigit() and 0 <= int(val) <= 5:
-            quality = int(val)
-        else:
-            print("无效输入，使用默认4")
-            quality = 4
-        rows.append({"title": c['title'], "quality": quality, "latency": round(latency,2)})
-    out_path = Path(args.out)
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    with out_path.open('w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=['title','quality','latency'])
-        writer.writeheader()
-        writer.writerows(rows)
-    print(f"[DONE] written {len(rows)} rows -> {out_path}")
+    log = AnswerLog(Path(args.out), args.append)
+    writer = PatchWriter(token, limiter) if args.apply else None
+    if writer:
+        workload.seed(rs.fetch_future_load(token, review_db, today_iso, names), after=today_obj)
+        writer.start()
+    prefetch = ThreadPoolExecutor(max_workers=2)
+    contents: Dict[int, Future] = {}
+
+    def schedule_prefetch(upto: int):
+        for j in range(upto, min(upto + PREFETCH_AHEAD, len(cards))):
+            if j not in contents:
+                contents[j] = prefetch.submit(fetch_card_content, token, cards[j]["id"], limiter)
+
+    try:
+        for idx, c in enumerate(cards):
+            schedule_prefetch(idx)
+            print(f"\n==== [{idx + 1}/{len(cards)}] {c['title']} ====")
+            input("按 ENTER 显示并开始计时...")
+            lines = contents.pop(idx).result()
+            for ln in lines:
+                print("  " + ln)
+            start = time.perf_counter()
+            input("回忆完毕后按 ENTER 停止计时...")
+            latency = time.perf_counter() - start
+            val = input("输入质量(0-5, 回车默认4, Q退出): ").strip().upper()
+            if val == 'Q':
+                print("[INFO] 用户中断，保存已收集数据")
+                break
+            if val == '':
+                quality = 4
+            elif val.isdigit() and 0 <= int(val) <= 5:
+                quality = int(val)
+            else:
+                print("无效输入，使用默认4")
+                quality = 4
+            log.add({"title": c['title'], "quality": quality, "latency": round(latency, 2)})
+            if writer:
+                sched = schedule_review(c["props"], quality=quality, today=today_obj, latency=latency)
+                sched = workload.assign(sched, today_obj)
+                writer.submit(c["id"], rs.build_updates(c["props"], sched, today_iso, names))
+    except (KeyboardInterrupt, EOFError):
+        print("\n[INFO] 用户中断，已收集数据均已保存")
+    finally:
+        prefetch.shutdown(wait=False, cancel_futures=True)
+        log.close()
+        if writer:
+            writer.close()
+            print(f"[INFO] updates applied={writer.ok} failed={writer.failed}")
+    print(f"[DONE] written {log.count} rows -> {args.out}")
     return 0
 
 if __name__ == '__main__':